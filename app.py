@@ -1,28 +1,56 @@
 import logging
+import os
+import signal
 import time
-from threading import Thread
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from threading import Event, Thread
 import pandas as pd
 from uuid import uuid4
 from sqlalchemy import text, bindparam
 import psql
 from services import (
     get_profile,
-    place_angelone_order,
-    get_auth,
+    get_session,
     get_historical_data,
     combine_historical_with_live_algo,
+    update_live_algo,
+    StrategyEngine,
     buy_sell_function12  # Make sure this is imported if you use it directly
 )
+from market_data import market_data_hub
+from journal import journal_writer
+from logs import configure_logging
+from metrics import STAGE_SECONDS, CYCLE_SECONDS, SIGNALS, ORDERS, ERRORS, start_metrics_server
+from tracing import span
+from candle_clock import candle_clock
+from ticks import start_tick_feed
+from bars import BASE_INTERVAL, timeframe_bars
+from orders import OrderDispatcher
 from creds import *
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
-# Configure logging
-logging.basicConfig(
-    filename='trading.log',
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+# Configure logging (queued, written by a background thread)
+configure_logging('trading.log')
+signals_log = logging.getLogger('signals')
+
+# Strategy runner settings
+CANDLE_INTERVAL = os.getenv('CANDLE_INTERVAL', 'FIVE_MINUTE')
+MAX_STRATEGY_WORKERS = int(os.getenv('MAX_STRATEGY_WORKERS', 200))
+MAX_STRATEGY_RESTARTS = int(os.getenv('MAX_STRATEGY_RESTARTS', 3))
+# Delay before the first restart of a crashed strategy; doubles with each further crash
+STRATEGY_RESTART_BACKOFF_SECONDS = float(os.getenv('STRATEGY_RESTART_BACKOFF_SECONDS', 5))
+STRATEGY_POLL_SECONDS = float(os.getenv('STRATEGY_POLL_SECONDS', 30))
+# With a tick feed, tokens without a tick for this long get their bar close from stock_details instead
+TICK_QUIET_SECONDS = float(os.getenv('TICK_QUIET_SECONDS', 30))
+
+# Set to stop claiming strategies and wind the workers down (SIGTERM, Ctrl-C)
+shutdown_event = Event()
+
+def request_shutdown() -> None:
+    """Stop claiming strategies and release every worker waiting for a bar."""
+    shutdown_event.set()
+    candle_clock.stop()
 
 def fetch_from_db(query: str, params: Dict[str, Any], error_message: str) -> Dict[str, Any]:
     """Helper function to fetch data from the database."""
@@ -36,29 +64,51 @@ def fetch_from_db(query: str, params: Dict[str, Any], error_message: str) -> Dic
         logging.error(f"Database query failed: {error_message} - {str(e)}", exc_info=True)
         raise
 
+# Every strategy's broker calls go through one rate-limited dispatcher
+order_dispatcher = OrderDispatcher(connect=lambda: get_session(api_key=api_key, username=username, pwd=pwd, token=token))
+
 def place_order(order_params: Dict[str, Any], user_id: int, stock_token: str) -> None:
     """Helper function to place an order."""
     try:
-        logging.info(f"Placing order with params: {order_params}")
-        result = place_angelone_order(
-            smart_api_obj=get_auth(api_key=api_key, username=username, pwd=pwd, token=token),
-            order_details=order_params
-        )
-        logging.info(f"Order placed successfully for user_id={user_id}, stock_token={stock_token}")
+        logging.info("Placing order with params: %s", order_params)
+        result = order_dispatcher.submit_order(order_params).result()
+        logging.info("Order placed successfully for user_id=%s, stock_token=%s", user_id, stock_token)
         return result
     except Exception as e:
         logging.error(f"Failed to place order for user_id={user_id}, stock_token={stock_token} - {str(e)}", exc_info=True)
         return None
 
-def trade_function(row: Dict[str, Any]) -> None:
-    """Processes a single trade based on the provided row data."""
+def load_base_history(stock_token: str) -> Optional[pd.DataFrame]:
+    """Fetch the last 10 days of BASE_INTERVAL bars for a token."""
+    smart_api_obj = get_session(api_key=api_key, username=username, pwd=pwd, token=token)
+    today = datetime.now()
+    fromdate = (today - timedelta(days=10)).strftime("%Y-%m-%d %H:%M")
+    todate = today.strftime("%Y-%m-%d %H:%M")
+    return get_historical_data(
+        smart_api_obj=smart_api_obj,
+        exchange="NSE",
+        symboltoken=stock_token,
+        interval=BASE_INTERVAL,
+        fromdate=fromdate,
+        todate=todate,
+        # Shares the dispatcher's getCandleData budget, so restarts and new strategies cannot burst past it
+        throttle=lambda: order_dispatcher.acquire('getCandleData'),
+    )
+
+def trade_function(row: Dict[str, Any], state: Optional[Dict[str, Any]] = None) -> None:
+    """Processes a single trade based on the provided row data.
+
+    `state` (order_id, position, trade_count) is kept current while the loop
+    runs, so a restarted worker resumes the same order instead of starting over.
+    """
+    state = {} if state is None else state
+    subscribed = False
     try:
         logging.info(f"Entering trade_function with row: {row}")
 
         # Extracting values from row
         quantity: int = row['quantity']
         stock_token: str = row['stock_token']
-        trade_count: int = row['trade_count']
         user_id: int = row['user_id']
         strategy_id: str = row['strategy_id']
         user_strategy_id: int = row['id']
@@ -70,239 +120,277 @@ def trade_function(row: Dict[str, Any]) -> None:
             f"Stock details not found for stock_token: {stock_token}"
         )
 
-        order_manager_uuid = str(uuid4())
-
-        # Insert into order_manager 
-        psql.execute_query(
-            raw_sql="""
-            INSERT INTO order_manager (
-                order_id, completed_order_count, buy_count, sell_count, is_active, created_at, updated_at, user_active_strategy_id
-            ) VALUES (
-                :order_id, :completed_order_count, :buy_count, :sell_count, :is_active, :created_at, :updated_at, :user_active_strategy_id
-            )
-            ON CONFLICT (order_id) DO NOTHING;
-            """,
-            params={
+        order_manager_uuid: Optional[str] = state.get('order_id')
+        if order_manager_uuid is None:
+            order_manager_uuid = str(uuid4())
+            # Insert into order_manager (written behind by the journal thread)
+            journal_writer.submit("order_created", {
                 "order_id": order_manager_uuid,
-                "completed_order_count": 0,
-                "buy_count": 0,
-                "sell_count": 0,
-                "is_active": True,
-                "created_at": datetime.now(),
-                "updated_at": datetime.now(),
                 "user_active_strategy_id": user_strategy_id,
-            }
-        )
-        logging.info(f"Order created with order_id={order_manager_uuid} for strategy_id={strategy_id}")
+            })
+            state['order_id'] = order_manager_uuid
+            logging.info(f"Order created with order_id={order_manager_uuid} for strategy_id={strategy_id}")
+        else:
+            logging.info(f"Resuming order_id={order_manager_uuid} for strategy_id={strategy_id} with state {state}")
+        trade_count: int = state.setdefault('trade_count', row['trade_count'])
+        current_position: Optional[str] = state.setdefault('position', None)  # Possible values: None, "buy", "sell"
+
+        # Live prices are aggregated into BASE_INTERVAL bars once per token and rolled up to
+        # CANDLE_INTERVAL, shared by every strategy on the token
+        market_data_hub.subscribe(stock_token)
+        timeframe_bars.track(stock_token, CANDLE_INTERVAL)
+        subscribed = True
 
         # --- Initialize historical data ---
-        # You should fetch historical data only once at the start
-        smart_api_obj = get_auth(api_key=api_key, username=username, pwd=pwd, token=token)
-        today = datetime.now()
-        fromdate = (today - timedelta(days=10)).strftime("%Y-%m-%d %H:%M")
-        todate = today.strftime("%Y-%m-%d %H:%M")
-        historical_df = get_historical_data(
-            smart_api_obj=smart_api_obj,
-            exchange="NSE",
-            symboltoken=stock_token,
-            interval="FIVE_MINUTE",
-            fromdate=fromdate,
-            todate=todate
-        )
+        # Base-interval history is fetched only once per token, whatever the strategies' intervals
+        historical_df = timeframe_bars.history(stock_token, CANDLE_INTERVAL, load=lambda: load_base_history(stock_token))
         if historical_df is None or historical_df.empty:
             logging.error("No historical data found, aborting trade_function.")
-            return
-
-        ovr_data = historical_df.copy()
-        current_position = None  # Possible values: None, "buy", "sell"
+            raise RuntimeError(f"No historical data for stock_token: {stock_token}")
 
-        def is_five_minute_window() -> bool:
-            now: datetime = datetime.now()
-            return now.minute % 5 == 0 and now.second == 1
+        engine = StrategyEngine(historical_df)
+        # A resumed position must still be closable by the engine's exit signals
+        engine.signals.flag_long = current_position == "buy"
+        engine.signals.flag_short = current_position == "sell"
+        # Only bars after the newest seeded one are fed; the engine has already folded in the history
+        last_bar_time = state.get('last_bar_time', historical_df['timestamp'].iloc[-1])
+        bar = candle_clock.register(CANDLE_INTERVAL)
 
         while trade_count > 0 or current_position is not None:
-            # Wait for the next 5-minute window
-            while not is_five_minute_window():
-                time.sleep(0.5)
-
-            logging.info(f"Entering while loop with trade_count: {trade_count}")
-
-            # Combine historical with latest LTP and recalculate signals
-            ovr_data = combine_historical_with_live_algo(historical_df=ovr_data, token=stock_token)
-            final_row: Dict[str, Any] = ovr_data.tail(1).to_dict(orient='records')[0]
-            with open("signals123.txt", "a") as f:
-                f.write(f"final_row: Dict[str, Any] signals = {final_row}\n")
-
-            if final_row.get('buy') == 1:
-                if current_position is None:
-                    trade_count -= 1
-                    current_position = "buy"
-                    order_params: Dict[str, Any] = {
-                        "variety": "NORMAL",
-                        "tradingsymbol": stock_details['stock_name'],
-                        "symboltoken": stock_token,
-                        "transactiontype": "BUY",
-                        "exchange": "NSE",
-                        "ordertype": "MARKET",
-                        "producttype": "INTRADAY",
-                        "duration": "DAY",
-                        "price": "0",
-                        "squareoff": "0",
-                        "stoploss": "0",
-                        "quantity": quantity
-                    }
-                    angelone_response = place_order(order_params, user_id, stock_token)
-                    with open("signals.txt", "a") as f:
-                        f.write(f"final_row: Dict[str, Any] buy = {final_row}\n {angelone_response}\n")
-                    psql.execute_query(
-                        raw_sql="""
-                        insert into 
-                            equity_trade_history (order_id, stock_token, trade_type, quantity, price, entry_ltp, exit_ltp, total_price, trade_entry_time, trade_exit_time
-                            )
-                            values
-                            (:order_id, :stock_token, :trade_type, :quantity, :price, :entry_ltp, :exit_ltp, :total_price, :trade_entry_time, :trade_exit_time)
-                        """,
-                        params={
-                            "order_id": order_manager_uuid,
-                            "stock_token": stock_token,
-                            "trade_type": "BUY",
-                            "quantity": quantity,
-                            "price": 0,
-                            "entry_ltp": final_row['close'],
-                            "exit_ltp": 0,
-                            "total_price": 0,
-                            "trade_entry_time": datetime.now(),
-                            "trade_exit_time": None
-                        }
-                    )
-                    psql.execute_query(
-                        raw_sql="""
-                        UPDATE order_manager
-                        SET buy_count = buy_count + 1
-                        WHERE order_id = :order_id;
-                        """,
-                        params={
-                            "order_id": order_manager_uuid
-                        }
-                    )
-                else:
-                    logging.info(f"Cannot place buy order. Current position: {current_position}")
-
-            elif final_row.get('sell') == 1:
-                if current_position is None:
-                    trade_count -= 1
-                    current_position = "sell"
-                    order_params: Dict[str, Any] = {
-                        "variety": "NORMAL",
-                        "tradingsymbol": stock_details['stock_name'],
-                        "symboltoken": stock_token,
-                        "transactiontype": "SELL",
-                        "exchange": "NSE",
-                        "ordertype": "MARKET",
-                        "producttype": "INTRADAY",
-                        "duration": "DAY",
-                        "price": "0",
-                        "squareoff": "0",
-                        "stoploss": "0",
-                        "quantity": quantity
-                    }
-                    angelone_response = place_order(order_params, user_id, stock_token)
-                    with open("signals.txt", "a") as f:
-                        f.write(f"final_row: Dict[str, Any] sell = {final_row}\n {angelone_response}\n")
-                    psql.execute_query(
-                        raw_sql="""
-                        insert into 
-                            equity_trade_history (order_id, stock_token, trade_type, quantity, price, entry_ltp, exit_ltp, total_price, trade_entry_time, trade_exit_time
-                            )
-                            values
-                            (:order_id, :stock_token, :trade_type, :quantity, :price, :entry_ltp, :exit_ltp, :total_price, :trade_entry_time, :trade_exit_time)
-                        """,
-                        params={
-                            "order_id": order_manager_uuid,
-                            "stock_token": stock_token,
-                            "trade_type": "SELL",
-                            "quantity": quantity,
-                            "price": 0,
-                            "entry_ltp": final_row['close'],
-                            "exit_ltp": 0,
-                            "total_price": 0,
-                            "trade_entry_time": datetime.now(),
-                            "trade_exit_time": None
-                        }
-                    )
-                    psql.execute_query(
-                        raw_sql="""
-                        UPDATE order_manager
-                        SET sell_count = sell_count + 1
-                        WHERE order_id = :order_id;
-                        """,
-                        params={
-                            "order_id": order_manager_uuid
-                        }
-                    )
-                else:
-                    logging.info(f"Cannot place sell order. Current position: {current_position}")
-
-            elif final_row.get('buy_exit') == 1:
-                if current_position == "buy":
-                    psql.execute_query("""
-                    UPDATE equity_trade_history
-                    SET exit_ltp = :exit_ltp, 
-                    trade_exit_time = :trade_exit_time
-                    WHERE order_id = :order_id;
-                    """, params={
-                        "exit_ltp": final_row['close'],
-                        "trade_exit_time": datetime.now(),
-                        "order_id": order_manager_uuid
-                    })
-                    current_position = None
-                    logging.info(f"Buy exit executed for stock_token={stock_token}")
-                else:
-                    logging.info(f"Cannot execute buy exit. Current position: {current_position}")
-
-            elif final_row.get('sell_exit') == 1:
-                if current_position == "sell":
-                    psql.execute_query("""
-                    UPDATE equity_trade_history
-                    SET exit_ltp = :exit_ltp, 
-                    trade_exit_time = :trade_exit_time
-                    WHERE order_id = :order_id;
-                    """, params={
-                        "exit_ltp": final_row['close'],
-                        "trade_exit_time": datetime.now(),
-                        "order_id": order_manager_uuid
-                    })
-                    current_position = None
-                    logging.info(f"Sell exit executed for stock_token={stock_token}")
-                else:
-                    logging.info(f"Cannot execute sell exit. Current position: {current_position}")
-
-            # Sleep to avoid double execution in the same minute
-            time.sleep(2)
+            # Block until the next candle closes; each bar is evaluated exactly once
+            next_bar = candle_clock.wait_for_bar(CANDLE_INTERVAL, bar)
+            if next_bar is None:
+                # request_shutdown() stopped the clock
+                logging.info(f"Shutting down, leaving strategy_id={strategy_id} with state {state}")
+                return
+            bar = next_bar
+            bar_close = candle_clock.bar_time(CANDLE_INTERVAL, bar)
+            STAGE_SECONDS.observe((datetime.now() - bar_close).total_seconds(), stage="wake")
+
+            # One trace per iteration (when sampled); DB, broker and EMA calls below become child spans
+            with span("strategy.iteration", strategy_id=strategy_id, token=stock_token, bar=str(bar_close)):
+                logging.info("Entering while loop with trade_count: %s", trade_count)
+
+                # Feed every bar closed since the last one handled into the EMA/signal engine, oldest
+                # first, so a late wake-up or a skipped clock tick cannot leave a bar out; no ticks means no bar
+                closed = timeframe_bars.bars_since(stock_token, CANDLE_INTERVAL, last_bar_time)
+                if not closed:
+                    logging.info("No completed bar for stock_token=%s this interval.", stock_token)
+                    continue
+                if len(closed) > 1:
+                    logging.warning(f"Catching up {len(closed)} {CANDLE_INTERVAL} bars for stock_token={stock_token}")
+                for completed in closed:
+                    if trade_count <= 0 and current_position is None:
+                        break
+                    last_bar_time = state['last_bar_time'] = completed['timestamp']
+                    with STAGE_SECONDS.time(stage="signal"):
+                        final_row: Dict[str, Any] = update_live_algo(engine=engine, token=stock_token, latest=completed)
+                    if final_row is None:
+                        continue
+                    signals_log.info("final_row signals = %s", final_row)
+                    for kind in ('buy', 'sell', 'buy_exit', 'sell_exit'):
+                        if final_row.get(kind) == 1:
+                            SIGNALS.inc(strategy_id=strategy_id, token=stock_token, signal=kind)
+
+                    if final_row.get('buy') == 1:
+                        if current_position is None:
+                            trade_count -= 1
+                            current_position = "buy"
+                            state.update(trade_count=trade_count, position=current_position)
+                            order_params: Dict[str, Any] = {
+                                "variety": "NORMAL",
+                                "tradingsymbol": stock_details['stock_name'],
+                                "symboltoken": stock_token,
+                                "transactiontype": "BUY",
+                                "exchange": "NSE",
+                                "ordertype": "MARKET",
+                                "producttype": "INTRADAY",
+                                "duration": "DAY",
+                                "price": "0",
+                                "squareoff": "0",
+                                "stoploss": "0",
+                                "quantity": quantity
+                            }
+                            with STAGE_SECONDS.time(stage="order"):
+                                angelone_response = place_order(order_params, user_id, stock_token)
+                            ORDERS.inc(strategy_id=strategy_id, token=stock_token, side="BUY", status="ok" if angelone_response else "failed")
+                            signals_log.info("final_row buy = %s response = %s", final_row, angelone_response)
+                            journal_writer.submit("trade_entry", {
+                                "order_id": order_manager_uuid,
+                                "stock_token": stock_token,
+                                "trade_type": "BUY",
+                                "quantity": quantity,
+                                "entry_ltp": final_row['close'],
+                            })
+                        else:
+                            logging.info("Cannot place buy order. Current position: %s", current_position)
+
+                    elif final_row.get('sell') == 1:
+                        if current_position is None:
+                            trade_count -= 1
+                            current_position = "sell"
+                            state.update(trade_count=trade_count, position=current_position)
+                            order_params: Dict[str, Any] = {
+                                "variety": "NORMAL",
+                                "tradingsymbol": stock_details['stock_name'],
+                                "symboltoken": stock_token,
+                                "transactiontype": "SELL",
+                                "exchange": "NSE",
+                                "ordertype": "MARKET",
+                                "producttype": "INTRADAY",
+                                "duration": "DAY",
+                                "price": "0",
+                                "squareoff": "0",
+                                "stoploss": "0",
+                                "quantity": quantity
+                            }
+                            with STAGE_SECONDS.time(stage="order"):
+                                angelone_response = place_order(order_params, user_id, stock_token)
+                            ORDERS.inc(strategy_id=strategy_id, token=stock_token, side="SELL", status="ok" if angelone_response else "failed")
+                            signals_log.info("final_row sell = %s response = %s", final_row, angelone_response)
+                            journal_writer.submit("trade_entry", {
+                                "order_id": order_manager_uuid,
+                                "stock_token": stock_token,
+                                "trade_type": "SELL",
+                                "quantity": quantity,
+                                "entry_ltp": final_row['close'],
+                            })
+                        else:
+                            logging.info("Cannot place sell order. Current position: %s", current_position)
+
+                    elif final_row.get('buy_exit') == 1:
+                        if current_position == "buy":
+                            journal_writer.submit("trade_exit", {"order_id": order_manager_uuid, "exit_ltp": final_row['close']})
+                            current_position = None
+                            state['position'] = None
+                            logging.info("Buy exit executed for stock_token=%s", stock_token)
+                        else:
+                            logging.info("Cannot execute buy exit. Current position: %s", current_position)
+
+                    elif final_row.get('sell_exit') == 1:
+                        if current_position == "sell":
+                            journal_writer.submit("trade_exit", {"order_id": order_manager_uuid, "exit_ltp": final_row['close']})
+                            current_position = None
+                            state['position'] = None
+                            logging.info("Sell exit executed for stock_token=%s", stock_token)
+                        else:
+                            logging.info("Cannot execute sell exit. Current position: %s", current_position)
+
+                CYCLE_SECONDS.observe((datetime.now() - bar_close).total_seconds())
 
     except Exception as e:
+        ERRORS.inc(strategy_id=row.get('strategy_id'), token=row.get('stock_token'))
         logging.error(f"Error processing trade for user_id={row.get('user_id')} - {str(e)}", exc_info=True)
+        raise
+    finally:
+        if subscribed:
+            timeframe_bars.untrack(row['stock_token'], CANDLE_INTERVAL)
+            market_data_hub.unsubscribe(row['stock_token'])
 
-def main() -> None:
-    """Main function to start the trading process."""
-    try:
-        data: List[Dict[str, Any]] = psql.execute_query(text("SELECT * FROM user_active_strategy WHERE is_started = false"))
-        if not data:
-            logging.info("No new strategies to start.")
-            return
+def claim_new_strategies(limit: int) -> List[Dict[str, Any]]:
+    """Mark up to `limit` not-yet-started strategies as started and return them."""
+    data: List[Dict[str, Any]] = psql.execute_query(
+        text("SELECT * FROM user_active_strategy WHERE is_started = false ORDER BY id LIMIT :limit"),
+        params={"limit": limit}
+    )
+    for row in data:
+        sql = text("UPDATE user_active_strategy SET is_started = true, status='active' WHERE id = :id")
+        psql.execute_query(sql, params={"id": row['id']})
+    if data:
+        logging.info(f"Updated is_started=true for IDs: {[row['id'] for row in data]}")
+    return data
+
+def poll_ltps(bar_time: datetime, quiet_only: bool = False) -> None:
+    """Feed subscribed tokens' LTPs from the database into the bar closing at bar_time, timed as the ltp_poll stage.
 
-        ids_to_update: List[int] = [row['id'] for row in data]
-        logging.info(f"Updated is_started=true for IDs: {ids_to_update}")
+    quiet_only (tick feed running) polls just the tokens the feed has gone quiet on.
+    """
+    with STAGE_SECONDS.time(stage="ltp_poll"):
+        tokens = None
+        if quiet_only:
+            tokens = market_data_hub.quiet_tokens(TICK_QUIET_SECONDS)
+            if not tokens:
+                return
+            logging.warning(f"No ticks for {len(tokens)} token(s) in {TICK_QUIET_SECONDS}s, closing their bars from the database: {tokens}")
+        market_data_hub.poll(tokens, close_at=bar_time)
 
-        for row in data:
-            sql = text("UPDATE user_active_strategy SET is_started = true, status='active' WHERE id = :id")
-            psql.execute_query(sql, params={"id": row['id']})
-            trade_function(row)
-            break  # Remove this break to process all rows or use threading for parallel execution
+def _supervise(pool: ThreadPoolExecutor, max_workers: int, poll_seconds: float) -> None:
+    """Claim strategies into free workers and restart crashed ones until shutdown_event is set."""
+    # future -> (row, restarts, worker state carried across restarts)
+    running: Dict[Future, Tuple[Dict[str, Any], int, Dict[str, Any]]] = {}
+    # Crashed strategies waiting out their backoff: (next_restart_at, row, restarts, state)
+    backoff: List[Tuple[float, Dict[str, Any], int, Dict[str, Any]]] = []
+    while not shutdown_event.is_set():
+        now = time.monotonic()
+        for item in [item for item in backoff if item[0] <= now]:
+            backoff.remove(item)
+            _, row, restarts, state = item
+            running[pool.submit(trade_function, row, state)] = (row, restarts, state)
 
+        # Only claim what we have free workers for (keeping one per pending restart), so nothing sits claimed but idle
+        free = max_workers - len(running) - len(backoff)
+        if free > 0:
+            try:
+                for row in claim_new_strategies(free):
+                    state: Dict[str, Any] = {}
+                    running[pool.submit(trade_function, row, state)] = (row, 0, state)
+            except Exception as e:
+                logging.error(f"Failed to claim new strategies - {str(e)}", exc_info=True)
+
+        timeout = min([poll_seconds] + [max(item[0] - time.monotonic(), 0) for item in backoff])
+        if not running:
+            shutdown_event.wait(timeout)
+            continue
+
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            row, restarts, state = running.pop(future)
+            error = future.exception()
+            if error is None:
+                logging.info(f"Strategy id={row['id']} finished.")
+            elif restarts < MAX_STRATEGY_RESTARTS:
+                # Back off exponentially, so a broker outage or rate limit does not use up every restart at once
+                delay = STRATEGY_RESTART_BACKOFF_SECONDS * 2 ** restarts
+                logging.warning(
+                    f"Restarting strategy id={row['id']} in {delay:.0f}s after crash ({restarts + 1}/{MAX_STRATEGY_RESTARTS}), "
+                    f"resuming {state}: {error}"
+                )
+                backoff.append((time.monotonic() + delay, row, restarts + 1, state))
+            else:
+                logging.error(f"Strategy id={row['id']} crashed {restarts + 1} times, giving up: {error}")
+
+def run_strategies(max_workers: int = MAX_STRATEGY_WORKERS, poll_seconds: float = STRATEGY_POLL_SECONDS) -> None:
+    """Run every claimed strategy in a worker pool, restarting workers that crash, until shutdown_event is set."""
+    # With a streaming feed the hub is kept current by ticks; the database only stands in for tokens that go quiet
+    quiet_only = start_tick_feed() is not None
+    # At each base bar close, poll the database into the closing bar. Registered before timeframe_bars.start()
+    # hooks in the bar aggregator, so the poll runs before the aggregator closes the bar at the same boundary.
+    candle_clock.register(BASE_INTERVAL, lambda interval, bar_time: poll_ltps(bar_time, quiet_only))
+    timeframe_bars.start()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="strategy") as pool:
+        try:
+            _supervise(pool, max_workers, poll_seconds)
+        finally:
+            # Runs before the pool joins its workers (also on Ctrl-C), so they wake up and return
+            request_shutdown()
+
+def main() -> None:
+    """Main function to start the trading process."""
+    # SIGTERM winds down like Ctrl-C: workers return, then queued orders and journal events are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: request_shutdown())
+    try:
+        journal_writer.start()
+        start_metrics_server()
+        run_strategies()
+    except KeyboardInterrupt:
+        logging.info("Interrupted, shutting down...")
     except Exception as e:
         logging.error("Error in main function", exc_info=True)
+    finally:
+        order_dispatcher.stop()
+        # Make sure every queued trade/order event reaches Postgres before exiting
+        journal_writer.stop()
 
 if __name__ == "__main__":
     logging.info("Starting trading process...")
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,103 @@
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from candles import CANDLE_STORE_EXTENSIONS, load_candles
+from services import EMA_SPANS, StrategyEngine
+
+
+def load_bars(path: str) -> pd.DataFrame:
+    """Load a candle file: CSV (like historical_data1.csv) or any save_candles() format."""
+    if path.endswith('.csv'):
+        df = pd.read_csv(path)
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df
+    for fmt, extension in CANDLE_STORE_EXTENSIONS.items():
+        if path.rstrip(os.sep).endswith(extension):
+            return load_candles(path.rstrip(os.sep), fmt)
+    raise ValueError(f"Unrecognised candle file: {path}")
+
+
+def run_backtest(
+    bars: pd.DataFrame,
+    quantity: int = 1,
+    trade_count: Optional[int] = None,
+    warmup_bars: int = max(EMA_SPANS.values()),
+    spans: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """Replay bars through the live StrategyEngine and simulate fills at each bar's close.
+
+    The first warmup_bars seed the EMAs (as the 10-day history does live);
+    every later close goes through StrategyEngine.on_price exactly like an
+    LTP tick, and positions follow trade_function: one position at a time,
+    at most trade_count entries. A position still open at the end is closed
+    at the last close and flagged as such.
+    """
+    bars = bars.reset_index(drop=True)
+    engine = StrategyEngine(bars.iloc[:warmup_bars], spans)
+
+    trades: List[Dict[str, Any]] = []
+    position: Optional[Dict[str, Any]] = None
+    entries_left = trade_count if trade_count is not None else len(bars)
+
+    closes = bars['close'].to_numpy(dtype=float)
+    timestamps = bars['timestamp'].to_numpy()
+    for i in range(warmup_bars, len(bars)):
+        close, timestamp = closes[i], timestamps[i]
+        event = engine.on_price(close, timestamp)
+        if event is None:
+            continue
+        if event in ('buy', 'sell') and position is None and entries_left > 0:
+            entries_left -= 1
+            position = {'side': 'BUY' if event == 'buy' else 'SELL', 'entry_time': timestamp, 'entry_price': close}
+        elif position is not None and (
+            (event == 'buy_exit' and position['side'] == 'BUY') or (event == 'sell_exit' and position['side'] == 'SELL')
+        ):
+            trades.append({**position, 'exit_time': timestamp, 'exit_price': close, 'open': False})
+            position = None
+        if position is None and entries_left <= 0:
+            break
+
+    if position is not None and len(bars) > warmup_bars:
+        trades.append({**position, 'exit_time': timestamps[-1], 'exit_price': closes[-1], 'open': True})
+
+    trades_df = pd.DataFrame(
+        trades, columns=['side', 'entry_time', 'entry_price', 'exit_time', 'exit_price', 'open']
+    )
+    direction = np.where(trades_df['side'] == 'BUY', 1.0, -1.0)
+    trades_df['pnl'] = (trades_df['exit_price'] - trades_df['entry_price']) * direction * quantity
+
+    equity = trades_df['pnl'].cumsum()
+    drawdown = (equity.cummax().clip(lower=0) - equity).max() if len(equity) else 0.0
+    wins = int((trades_df['pnl'] > 0).sum())
+    summary = {
+        'bars': len(bars),
+        'trades': len(trades_df),
+        'wins': wins,
+        'losses': int((trades_df['pnl'] < 0).sum()),
+        'win_rate': wins / len(trades_df) if len(trades_df) else 0.0,
+        'total_pnl': float(trades_df['pnl'].sum()),
+        'max_drawdown': float(drawdown),
+    }
+    return {'trades': trades_df, 'summary': summary}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backtest the EMA crossover strategy on a candle file, offline.")
+    parser.add_argument("path", help="candle CSV or binary candle store file")
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--trade-count", type=int, default=None)
+    parser.add_argument("--warmup-bars", type=int, default=max(EMA_SPANS.values()))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = run_backtest(load_bars(args.path), args.quantity, args.trade_count, args.warmup_bars)
+    logging.info(f"Backtest of {args.path} finished in {time.perf_counter() - started:.2f}s")
+    print(result['trades'].to_string(index=False))
+    print(result['summary'])
@@ -0,0 +1,395 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from candle_clock import INTERVAL_SECONDS, candle_clock
+from candles import CandleBuffer, PRICE_COLUMNS, _local_times
+from market_data import MarketDataHub, market_data_hub
+
+# Every timeframe is derived from bars of this interval; it must divide each of them
+BASE_INTERVAL = os.getenv('BASE_INTERVAL', 'ONE_MINUTE')
+# Bars kept per token: base series (about ten sessions of one-minute bars) and each derived series
+TIMEFRAME_BASE_BARS = int(os.getenv('TIMEFRAME_BASE_BARS', 4000))
+TIMEFRAME_BARS = int(os.getenv('TIMEFRAME_BARS', 1000))
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Per-token working bar: [bar index, open, high, low, close, volume, last closed bar index]
+_BAR, _OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _CLOSED = range(7)
+
+BarCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class BarAggregator:
+    """Builds OHLCV bars of one interval from live prices, per token.
+
+    Ticks are folded into a fixed per-token slot (a short list updated in
+    place), so a tick allocates nothing; a dict is only built when a bar
+    completes. A bar completes when the first tick of a later bar arrives or
+    when flush() runs at the candle boundary, whichever comes first. Ticks
+    for an already completed bar are dropped. Bars are stamped with their
+    start time on the local wall clock, like the broker's candles.
+    """
+
+    def __init__(self, interval: str, hub: MarketDataHub = market_data_hub) -> None:
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        self.interval = interval
+        self.length = INTERVAL_SECONDS[interval]
+        self.hub = hub
+        self._lock = threading.Lock()
+        self._slots: Dict[str, List[float]] = {}
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._tracked: Dict[str, int] = {}
+        self._callbacks: List[BarCallback] = []
+        self.late_ticks = 0
+
+    def _bar_index(self, timestamp: Any) -> int:
+        if timestamp is None:
+            seconds = time.time() + time.localtime().tm_gmtoff
+        else:
+            # Broker timestamps carry the exchange offset; its wall time is what bars are cut on
+            if getattr(timestamp, 'tzinfo', None) is not None:
+                timestamp = timestamp.replace(tzinfo=None)
+            seconds = (timestamp - _EPOCH).total_seconds()
+        return int(seconds // self.length)
+
+    def _bar_time(self, bar: int) -> datetime:
+        return _EPOCH + timedelta(seconds=bar * self.length)
+
+    def _complete(self, token: str, slot: List[float]) -> Dict[str, Any]:
+        bar = {
+            'timestamp': self._bar_time(int(slot[_BAR])),
+            'open': slot[_OPEN],
+            'high': slot[_HIGH],
+            'low': slot[_LOW],
+            'close': slot[_CLOSE],
+            'volume': slot[_VOLUME],
+        }
+        slot[_CLOSED] = slot[_BAR]
+        slot[_BAR] = -1
+        self._last[token] = bar
+        return bar
+
+    def _emit(self, token: str, bar: Dict[str, Any]) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(token, bar)
+            except Exception as e:
+                logging.error(f"Bar subscriber failed for token={token}: {str(e)}", exc_info=True)
+
+    def on_tick(self, token: str, latest: Dict[str, Any]) -> None:
+        """Fold one price ({'timestamp', 'close'[, 'volume']}) into the token's working bar."""
+        price = latest.get('close')
+        if price is None:
+            return
+        price = float(price)
+        volume = float(latest.get('volume') or 0.0)
+        bar = self._bar_index(latest.get('timestamp'))
+        completed = None
+        with self._lock:
+            slot = self._slots.get(token)
+            if slot is None:
+                slot = self._slots[token] = [-1, 0.0, 0.0, 0.0, 0.0, 0.0, -1]
+            if bar == slot[_BAR]:
+                if price > slot[_HIGH]:
+                    slot[_HIGH] = price
+                elif price < slot[_LOW]:
+                    slot[_LOW] = price
+                slot[_CLOSE] = price
+                slot[_VOLUME] += volume
+                return
+            if bar < slot[_BAR] or bar <= slot[_CLOSED]:
+                self.late_ticks += 1
+                return
+            if slot[_BAR] >= 0:
+                completed = self._complete(token, slot)
+            slot[_BAR] = bar
+            slot[_OPEN] = slot[_HIGH] = slot[_LOW] = slot[_CLOSE] = price
+            slot[_VOLUME] = volume
+        if completed is not None:
+            self._emit(token, completed)
+
+    def flush(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Complete every working bar that started before the bar containing now."""
+        current = self._bar_index(now)
+        completed = []
+        with self._lock:
+            for token, slot in self._slots.items():
+                if 0 <= slot[_BAR] < current:
+                    completed.append((token, self._complete(token, slot)))
+        for token, bar in completed:
+            self._emit(token, bar)
+        return [bar for _, bar in completed]
+
+    def last_bar(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the token's most recently completed bar."""
+        with self._lock:
+            return self._last.get(token)
+
+    def on_bar(self, callback: BarCallback) -> None:
+        """Call callback(token, bar) for every completed bar."""
+        self._callbacks.append(callback)
+
+    def track(self, token: str) -> None:
+        """Start aggregating a token's prices from the hub (once, however many strategies ask)."""
+        with self._lock:
+            count = self._tracked.get(token, 0)
+            self._tracked[token] = count + 1
+        if count == 0:
+            self.hub.subscribe(token, self.on_tick)
+
+    def untrack(self, token: str) -> None:
+        """Drop one track(); the hub subscription and bar state go with the last one."""
+        with self._lock:
+            count = self._tracked.get(token, 0) - 1
+            if count > 0:
+                self._tracked[token] = count
+                return
+            self._tracked.pop(token, None)
+            self._slots.pop(token, None)
+            self._last.pop(token, None)
+        if count == 0:
+            self.hub.unsubscribe(token, self.on_tick)
+
+
+_aggregators: Dict[str, BarAggregator] = {}
+_aggregators_lock = threading.Lock()
+
+
+def get_bar_aggregator(interval: str) -> BarAggregator:
+    """Return the shared aggregator for an interval, flushed by the candle clock at each boundary."""
+    with _aggregators_lock:
+        aggregator = _aggregators.get(interval)
+        if aggregator is None:
+            aggregator = _aggregators[interval] = BarAggregator(interval)
+            candle_clock.register(interval, lambda interval, bar_time: aggregator.flush(bar_time))
+        return aggregator
+
+
+def resample_bars(bars: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Roll time-ordered bars up to a longer interval, cut on wall-clock boundaries like the live aggregator."""
+    length = INTERVAL_SECONDS[interval]
+    if bars.empty:
+        return pd.DataFrame(columns=['timestamp', *PRICE_COLUMNS])
+    times = pd.to_datetime(_local_times(pd.to_datetime(bars['timestamp'])))
+    index = times.to_numpy(dtype='datetime64[s]').astype(np.int64) // length
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    ends = np.r_[starts[1:], len(index)] - 1
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(index[starts] * length, unit='s'),
+        'open': bars['open'].to_numpy(dtype=float)[starts],
+        'high': np.maximum.reduceat(bars['high'].to_numpy(dtype=float), starts),
+        'low': np.minimum.reduceat(bars['low'].to_numpy(dtype=float), starts),
+        'close': bars['close'].to_numpy(dtype=float)[ends],
+        'volume': np.add.reduceat(bars['volume'].to_numpy(dtype=float), starts),
+    })
+
+
+class TimeframeBars:
+    """One base-interval bar series per token, with every longer timeframe derived from it.
+
+    A token's history is fetched once, at the base interval, and its live
+    prices are aggregated once; 5m/15m/1h bars are resampled from the base
+    series the first time a strategy asks for that timeframe and then kept
+    up to date incrementally as each base bar completes, for every strategy
+    on the token. Derived bars are cut on wall-clock boundaries.
+    """
+
+    def __init__(
+        self,
+        base_interval: str = BASE_INTERVAL,
+        base_capacity: int = TIMEFRAME_BASE_BARS,
+        capacity: int = TIMEFRAME_BARS,
+    ) -> None:
+        self.base_interval = base_interval
+        self.base_length = INTERVAL_SECONDS[base_interval]
+        self.base_capacity = base_capacity
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._seed_locks: Dict[str, threading.Lock] = {}
+        self._seeded: set = set()
+        self._base: Dict[str, CandleBuffer] = {}
+        # (token, interval) -> completed bars / working bar [index, open, high, low, close, volume] / last bar
+        self._frames: Dict[Tuple[str, str], CandleBuffer] = {}
+        self._working: Dict[Tuple[str, str], List[float]] = {}
+        self._last: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._tracked: Dict[Tuple[str, str], int] = {}
+        self._aggregator: Optional[BarAggregator] = None
+
+    def start(self) -> None:
+        """Hook the base aggregator into the candle clock (register any LTP poll on BASE_INTERVAL first)."""
+        with self._lock:
+            if self._aggregator is not None:
+                return
+            self._aggregator = get_bar_aggregator(self.base_interval)
+        self._aggregator.on_bar(self._on_base_bar)
+        # Runs after the aggregator's own flush, so the closing base bar is already folded in
+        candle_clock.register(self.base_interval, lambda interval, bar_time: self.flush(bar_time))
+
+    def _check_interval(self, interval: str) -> None:
+        length = INTERVAL_SECONDS.get(interval)
+        if length is None or length % self.base_length:
+            raise ValueError(f"{interval} is not a multiple of the base interval {self.base_interval}")
+
+    def track(self, token: str, interval: str) -> None:
+        """Follow a token at an interval; the token's base series is shared by all its intervals."""
+        self._check_interval(interval)
+        self.start()
+        with self._lock:
+            new_token = not any(key[0] == token for key in self._tracked)
+            self._tracked[(token, interval)] = self._tracked.get((token, interval), 0) + 1
+        if new_token:
+            self._aggregator.track(token)
+
+    def untrack(self, token: str, interval: str) -> None:
+        """Drop one track(); a token's bars are released with its last tracked interval."""
+        key = (token, interval)
+        with self._lock:
+            count = self._tracked.get(key, 0) - 1
+            if count > 0:
+                self._tracked[key] = count
+                return
+            self._tracked.pop(key, None)
+            for store in (self._frames, self._working, self._last):
+                store.pop(key, None)
+            last_interval = not any(key[0] == token for key in self._tracked)
+            if last_interval:
+                self._base.pop(token, None)
+                self._seeded.discard(token)
+        if last_interval and count == 0:
+            self._aggregator.untrack(token)
+
+    def _base_buffer(self, token: str) -> CandleBuffer:
+        buffer = self._base.get(token)
+        if buffer is None:
+            buffer = self._base[token] = CandleBuffer(self.base_capacity, PRICE_COLUMNS)
+        return buffer
+
+    def _seed(self, token: str, load: Callable[[], Optional[pd.DataFrame]]) -> bool:
+        with self._lock:
+            seed_lock = self._seed_locks.setdefault(token, threading.Lock())
+        with seed_lock:
+            if token in self._seeded:
+                return True
+            history = load()
+            if history is None or history.empty:
+                return False
+            history = history[['timestamp', *PRICE_COLUMNS]].copy()
+            history['timestamp'] = _local_times(pd.to_datetime(history['timestamp']))
+            # The broker's newest candle may still be forming; the live aggregator owns it
+            forming = _EPOCH + timedelta(seconds=(time.time() + time.localtime().tm_gmtoff) // self.base_length * self.base_length)
+            with self._lock:
+                live = self._base_buffer(token).to_frame()
+                cutoff = min(forming, pd.Timestamp(live['timestamp'].iloc[0])) if len(live) else forming
+                merged = pd.concat([history[history['timestamp'] < cutoff], live], ignore_index=True)
+                buffer = self._base[token] = CandleBuffer(self.base_capacity, PRICE_COLUMNS)
+                buffer.extend(merged)
+                # Derived series resampled before the seed are rebuilt on next use
+                for key in [key for key in self._frames if key[0] == token]:
+                    for store in (self._frames, self._working, self._last):
+                        store.pop(key, None)
+                self._seeded.add(token)
+            logging.info(f"Seeded {len(merged)} {self.base_interval} bars for token={token}")
+            return True
+
+    def _derive(self, token: str, interval: str) -> CandleBuffer:
+        """Resample the token's base series to interval; an unfinished last bar becomes the working bar."""
+        key = (token, interval)
+        length = INTERVAL_SECONDS[interval]
+        base = self._base_buffer(token).to_frame()
+        derived = resample_bars(base, interval)
+        working = None
+        if len(derived):
+            last_base = (pd.Timestamp(base['timestamp'].iloc[-1]) - _EPOCH).total_seconds()
+            last = derived.iloc[-1]
+            if last_base + self.base_length < (last['timestamp'] - _EPOCH).total_seconds() + length:
+                working = [int((last['timestamp'] - _EPOCH).total_seconds() // length),
+                           last['open'], last['high'], last['low'], last['close'], last['volume']]
+                derived = derived.iloc[:-1]
+        frame = self._frames[key] = CandleBuffer(self.capacity, PRICE_COLUMNS)
+        frame.extend(derived)
+        if working is not None:
+            self._working[key] = working
+        last_row = frame.last()
+        if last_row is not None:
+            self._last[key] = last_row
+        return frame
+
+    def _complete(self, key: Tuple[str, str], working: List[float]) -> None:
+        bar = {
+            'timestamp': _EPOCH + timedelta(seconds=int(working[0]) * INTERVAL_SECONDS[key[1]]),
+            'open': working[1],
+            'high': working[2],
+            'low': working[3],
+            'close': working[4],
+            'volume': working[5],
+        }
+        self._frames[key].append(bar)
+        self._last[key] = bar
+        self._working.pop(key, None)
+
+    def _on_base_bar(self, token: str, bar: Dict[str, Any]) -> None:
+        start = (bar['timestamp'] - _EPOCH).total_seconds()
+        with self._lock:
+            if not any(key[0] == token for key in self._tracked):
+                return
+            self._base_buffer(token).append(bar)
+            for key in [key for key in self._tracked if key[0] == token]:
+                if key not in self._frames:
+                    self._derive(*key)
+                    continue
+                length = INTERVAL_SECONDS[key[1]]
+                index = int(start // length)
+                working = self._working.get(key)
+                if working is not None and working[0] != index:
+                    self._complete(key, working)
+                    working = None
+                if working is None:
+                    working = self._working[key] = [index, bar['open'], bar['high'], bar['low'], bar['close'], bar['volume']]
+                else:
+                    working[2] = max(working[2], bar['high'])
+                    working[3] = min(working[3], bar['low'])
+                    working[4] = bar['close']
+                    working[5] += bar['volume']
+                if start + self.base_length >= (index + 1) * length:
+                    self._complete(key, working)
+
+    def flush(self, now: Optional[datetime] = None) -> None:
+        """Complete derived bars that ended by now even if their last base bar had no ticks."""
+        now_seconds = (now - _EPOCH).total_seconds() if now is not None else time.time() + time.localtime().tm_gmtoff
+        with self._lock:
+            for key, working in list(self._working.items()):
+                if (working[0] + 1) * INTERVAL_SECONDS[key[1]] <= now_seconds:
+                    self._complete(key, working)
+
+    def history(self, token: str, interval: str, load: Callable[[], Optional[pd.DataFrame]]) -> pd.DataFrame:
+        """Completed bars for a token at interval; load() fetches base-interval history, once per token."""
+        self._check_interval(interval)
+        if not self._seed(token, load):
+            return pd.DataFrame(columns=['timestamp', *PRICE_COLUMNS])
+        with self._lock:
+            frame = self._frames.get((token, interval))
+            if frame is None:
+                frame = self._derive(token, interval)
+            return frame.to_frame()
+
+    def bars_since(self, token: str, interval: str, timestamp: Any) -> List[Dict[str, Any]]:
+        """Completed bars of a token at interval stamped after timestamp, oldest first."""
+        with self._lock:
+            frame = self._frames.get((token, interval))
+            return frame.since(timestamp) if frame is not None else []
+
+    def last_bar(self, token: str, interval: str) -> Optional[Dict[str, Any]]:
+        """Return the most recently completed bar of a token at interval."""
+        with self._lock:
+            return self._last.get((token, interval))
+
+
+timeframe_bars = TimeframeBars()
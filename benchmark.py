@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+import journal
+import psql
+import services
+from broker_sim import SimulatedSmartConnect
+from candles import CandleCache
+from market_data import MarketDataHub
+
+BENCH_RESULTS_DIR = os.getenv('BENCH_RESULTS_DIR', 'bench_results')
+HISTORY_LENGTHS = (1_000, 10_000, 100_000)
+STRATEGY_COUNTS = (1, 10, 100)
+# Strategies share tokens: each count is also run spread over at most this many tokens (and on one token)
+TOKEN_SPREAD = 10
+
+SQLITE_SCHEMA = [
+    "CREATE TABLE stock_details (id INTEGER PRIMARY KEY, stock_name TEXT, token TEXT UNIQUE, ltp FLOAT, last_update TIMESTAMP)",
+    """CREATE TABLE order_manager (
+        id INTEGER PRIMARY KEY, order_id TEXT UNIQUE, completed_order_count INT, buy_count INT, sell_count INT,
+        is_active BOOLEAN, created_at TIMESTAMP, updated_at TIMESTAMP, user_active_strategy_id INT)""",
+    """CREATE TABLE equity_trade_history (
+        id INTEGER PRIMARY KEY, order_id TEXT, stock_token TEXT, trade_type TEXT, quantity INT, price FLOAT,
+        entry_ltp FLOAT, exit_ltp FLOAT, total_price FLOAT, trade_entry_time TIMESTAMP, trade_exit_time TIMESTAMP)""",
+]
+
+# SQLite has no data-modifying CTEs, so the stand-in journals an entry as an INSERT + UPDATE pair
+SQLITE_TRADE_INSERT_SQL = """
+INSERT INTO equity_trade_history (order_id, stock_token, trade_type, quantity, price, entry_ltp, exit_ltp, total_price, trade_entry_time, trade_exit_time)
+VALUES (:order_id, :stock_token, :trade_type, :quantity, :price, :entry_ltp, :exit_ltp, :total_price, :trade_entry_time, :trade_exit_time)
+"""
+SQLITE_COUNTER_SQL = "UPDATE order_manager SET buy_count = buy_count + 1 WHERE order_id = :order_id"
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Run fn repeat times and return per-call timings in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'min_ms': min(samples), 'median_ms': statistics.median(samples), 'mean_ms': statistics.fmean(samples), 'runs': repeat}
+
+
+def _synthetic_history(length: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 800 + np.cumsum(rng.normal(0, 0.5, length))
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2025-01-01 09:15', periods=length, freq='5min'),
+        'open': close, 'high': close + 0.5, 'low': close - 0.5, 'close': close, 'volume': 1000.0,
+    })
+    for name, span in services.EMA_SPANS.items():
+        df[name] = df['close'].ewm(span=span, adjust=False).mean()
+    for column in services.SIGNAL_COLUMNS:
+        df[column] = np.nan
+    return df
+
+
+def use_database(db_url: Optional[str] = None) -> bool:
+    """Point psql at db_url, or at a seeded in-memory SQLite stand-in. Returns True for Postgres."""
+    if db_url:
+        psql.engine = create_engine(db_url, pool_pre_ping=True)
+        return psql.engine.dialect.name == 'postgresql'
+    psql.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    for statement in SQLITE_SCHEMA:
+        psql.execute_query(statement)
+    psql.execute_many(
+        "INSERT INTO stock_details (stock_name, token, ltp, last_update) VALUES (:name, :token, :ltp, :ts)",
+        [{'name': f'SYM{i}', 'token': str(i), 'ltp': 800.0, 'ts': datetime.now()} for i in range(max(STRATEGY_COUNTS))],
+    )
+    return False
+
+
+def bench_tick(results: Dict[str, Any]) -> None:
+    """Per-tick evaluation: legacy full ewm recompute vs the streaming engine."""
+    for length in HISTORY_LENGTHS:
+        history = _synthetic_history(length)
+        repeat = 20 if length <= 10_000 else 5
+        results[f'tick/combine_historical_with_live_algo/{length}'] = _timed(
+            lambda: services.combine_historical_with_live_algo(history, '0'), repeat
+        )
+        engine = services.StrategyEngine(history)
+        results[f'tick/update_live_algo/{length}'] = _timed(lambda: services.update_live_algo(engine, '0'), 200)
+        results[f'tick/engine_on_price/{length}'] = _timed(lambda: engine.on_price(800.0), 1_000)
+
+
+def bench_signals(results: Dict[str, Any]) -> None:
+    """Full-history signal generation: row loop vs vectorized kernel."""
+    for length in HISTORY_LENGTHS:
+        history = _synthetic_history(length)
+        results[f'signals/buy_sell_function12/{length}'] = _timed(lambda: services.buy_sell_function12(history), 3)
+        results[f'signals/buy_sell_vectorized/{length}'] = _timed(lambda: services.buy_sell_vectorized(history), 20)
+
+
+def bench_history(results: Dict[str, Any]) -> None:
+    """History load for N strategies on one token: cold cache, then warm cache."""
+    broker = SimulatedSmartConnect(latency_ms=0, jitter_ms=0, rate_limits={})
+    todate = datetime.now().strftime("%Y-%m-%d %H:%M")
+    fromdate = (datetime.now() - timedelta(days=10)).strftime("%Y-%m-%d %H:%M")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for count in STRATEGY_COUNTS:
+            def load() -> None:
+                services.candle_cache = CandleCache(cache_dir=None)
+                for _ in range(count):
+                    services.get_historical_data(broker, "NSE", "0", "FIVE_MINUTE", fromdate, todate)
+            results[f'history/get_historical_data/{count}_strategies'] = _timed(load, 3)
+        services.candle_cache = CandleCache(cache_dir=cache_dir)
+        services.get_historical_data(broker, "NSE", "0", "FIVE_MINUTE", fromdate, todate)
+        results['history/get_historical_data/disk_reload'] = _timed(
+            lambda: CandleCache(cache_dir=cache_dir).get("0", "NSE", "FIVE_MINUTE", fromdate, todate, fetch=None), 10
+        )
+
+
+def bench_db(results: Dict[str, Any], postgres: bool) -> None:
+    """LTP reads and order journaling at several strategy counts."""
+    results['db/execute_query/select_1'] = _timed(lambda: psql.execute_query("SELECT 1"), 200)
+    results['db/get_latest_ltp_from_db'] = _timed(lambda: services.get_latest_ltp_from_db('0'), 200)
+    for count in STRATEGY_COUNTS:
+        for token_count in sorted({1, min(TOKEN_SPREAD, count)}):
+            # One token per strategy, round-robin over token_count tokens
+            tokens = [str(i % token_count) for i in range(count)]
+            name = f'{count}x{token_count}_tokens'
+            results[f'db/ltp_per_strategy/{name}'] = _timed(lambda: [services.get_latest_ltp_from_db(t) for t in tokens], 5)
+            hub = MarketDataHub(fetch_many=services.get_latest_ltps_from_db if postgres else None)
+            for token in tokens:
+                hub.subscribe(token)
+            results[f'db/ltp_hub_poll/{name}'] = _timed(hub.poll, 5)
+
+        order_ids = [f'bench-{count}-{i}-{time.time_ns()}' for i in range(count)]
+        psql.execute_many(journal.ORDER_CREATED_SQL, [journal._order_params({'order_id': o, 'user_active_strategy_id': 0}) for o in order_ids])
+        entries = [
+            {'order_id': o, 'stock_token': '0', 'trade_type': 'BUY', 'quantity': 1, 'entry_ltp': 800.0}
+            for o in order_ids
+        ]
+        if postgres:
+            single = lambda: [journal.journal_trade_entry(**entry) for entry in entries]
+            bulk = lambda: journal.journal_trade_entries(entries)
+        else:
+            params = [journal._entry_params(entry) for entry in entries]
+            single = lambda: [
+                (psql.execute_query(SQLITE_TRADE_INSERT_SQL, p), psql.execute_query(SQLITE_COUNTER_SQL, p)) for p in params
+            ]
+            bulk = lambda: psql.execute_batches([(SQLITE_TRADE_INSERT_SQL, params), (SQLITE_COUNTER_SQL, params)])
+        results[f'journal/per_order/{count}'] = _timed(single, 3)
+        results[f'journal/bulk/{count}'] = _timed(bulk, 3)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> pd.DataFrame:
+    """Median timings side by side with the ratio current / baseline."""
+    rows = []
+    for name, timing in current['results'].items():
+        before = baseline['results'].get(name)
+        rows.append({
+            'benchmark': name,
+            'baseline_ms': before['median_ms'] if before else np.nan,
+            'current_ms': timing['median_ms'],
+            'ratio': timing['median_ms'] / before['median_ms'] if before else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def run_benchmarks(groups: List[str], db_url: Optional[str] = None) -> Dict[str, Any]:
+    """Run the selected benchmark groups and return the timings with run metadata."""
+    postgres = use_database(db_url)
+    results: Dict[str, Any] = {}
+    if 'tick' in groups:
+        bench_tick(results)
+    if 'signals' in groups:
+        bench_signals(results)
+    if 'history' in groups:
+        bench_history(results)
+    if 'db' in groups:
+        bench_db(results, postgres)
+    return {
+        'revision': _git_revision(),
+        'created_at': datetime.now().isoformat(),
+        'database': psql.engine.dialect.name,
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the strategy hot path with local stand-ins.")
+    parser.add_argument("--groups", nargs="+", default=['tick', 'signals', 'history', 'db'],
+                        choices=['tick', 'signals', 'history', 'db'])
+    parser.add_argument("--db-url", default=None, help="benchmark against this database instead of in-memory SQLite")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmarks(args.groups, args.db_url)
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(BENCH_RESULTS_DIR, f"{report['revision']}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)).to_string(index=False))
+    else:
+        print(pd.DataFrame(report['results']).T.to_string())
+    print(f"Saved results to {out_path}")
@@ -0,0 +1,158 @@
+import hashlib
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from candle_clock import INTERVAL_SECONDS
+
+# Simulator settings (used when BROKER_BACKEND=simulator)
+SIM_LATENCY_MS = float(os.getenv('SIM_LATENCY_MS', 50))
+SIM_LATENCY_JITTER_MS = float(os.getenv('SIM_LATENCY_JITTER_MS', 20))
+SIM_ERROR_RATE = float(os.getenv('SIM_ERROR_RATE', 0))
+SIM_SEED = int(os.getenv('SIM_SEED', 0))
+
+# Requests per second per endpoint, roughly the broker's published limits
+SIM_RATE_LIMITS: Dict[str, int] = {
+    'generateSession': 1,
+    'generateToken': 1,
+    'getProfile': 3,
+    'getCandleData': 3,
+    'placeOrder': 20,
+}
+
+MARKET_OPEN = "09:15"
+MARKET_CLOSE = "15:30"
+
+
+class SimulatedBrokerError(Exception):
+    """Raised for injected failures and rate-limit rejections."""
+
+
+class SimulatedSmartConnect:
+    """In-process stand-in for SmartApi.SmartConnect.
+
+    Implements generateSession, generateToken, getProfile, getCandleData and
+    placeOrder with the same response shapes, plus configurable latency,
+    per-endpoint rate limits (sliding one-second window, shared by every
+    instance like the real per-account limit) and random error injection.
+    Candles are synthetic but deterministic per token, interval and time.
+    """
+
+    _rate_lock = threading.Lock()
+    _calls: Dict[str, deque] = {}
+    _order_ids = itertools.count(1)
+
+    def __init__(
+        self,
+        api_key: str = "",
+        latency_ms: float = SIM_LATENCY_MS,
+        jitter_ms: float = SIM_LATENCY_JITTER_MS,
+        error_rate: float = SIM_ERROR_RATE,
+        rate_limits: Optional[Dict[str, int]] = None,
+        seed: int = SIM_SEED,
+    ) -> None:
+        self.api_key = api_key
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limits = dict(SIM_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.seed = seed
+        self._random = random.Random(seed)
+        self.orders: List[Dict[str, Any]] = []
+        self.access_token: Optional[str] = None
+
+    def _call(self, endpoint: str) -> None:
+        """Apply rate limit, latency and error injection for one request."""
+        limit = self.rate_limits.get(endpoint)
+        if limit:
+            now = time.monotonic()
+            with self._rate_lock:
+                calls = self._calls.setdefault(endpoint, deque())
+                while calls and now - calls[0] >= 1.0:
+                    calls.popleft()
+                if len(calls) >= limit:
+                    raise SimulatedBrokerError(f"Access denied because of exceeding access rate ({endpoint})")
+                calls.append(now)
+        delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise SimulatedBrokerError(f"Simulated failure in {endpoint}")
+
+    def generateSession(self, clientCode: str, password: str, totp: str) -> Dict[str, Any]:
+        self._call('generateSession')
+        self.access_token = f"sim-jwt-{clientCode}-{time.time_ns()}"
+        return {
+            'status': True,
+            'message': 'SUCCESS',
+            'data': {
+                'clientcode': clientCode,
+                'jwtToken': self.access_token,
+                'refreshToken': f"sim-refresh-{clientCode}",
+                'feedToken': f"sim-feed-{clientCode}",
+            },
+        }
+
+    def generateToken(self, refresh_token: str) -> Dict[str, Any]:
+        self._call('generateToken')
+        self.access_token = f"sim-jwt-{time.time_ns()}"
+        return {
+            'status': True,
+            'message': 'SUCCESS',
+            'data': {'jwtToken': self.access_token, 'refreshToken': refresh_token, 'feedToken': 'sim-feed'},
+        }
+
+    def getProfile(self, refresh_token: str) -> Dict[str, Any]:
+        self._call('getProfile')
+        return {'status': True, 'message': 'SUCCESS', 'data': {'name': 'SIMULATED', 'exchanges': ['NSE']}}
+
+    def _closes(self, token: str, timestamps: pd.DatetimeIndex, interval_seconds: int) -> np.ndarray:
+        # Deterministic price path: two sine waves plus per-bar noise keyed by (seed, token, bar)
+        digest = hashlib.sha256(f"{self.seed}:{token}".encode()).digest()
+        base = 100 + int.from_bytes(digest[:2], 'big') % 2000
+        seconds = timestamps.asi8 // 10 ** 9
+        bars = seconds // interval_seconds
+        noise = ((bars * 2654435761 + int.from_bytes(digest[2:6], 'big')) % 1000) / 1000 - 0.5
+        return base * (1 + 0.01 * np.sin(2 * np.pi * seconds / 86400) + 0.004 * np.sin(2 * np.pi * seconds / 3420)) + noise
+
+    def getCandleData(self, historicDataParams: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            self._call('getCandleData')
+        except SimulatedBrokerError as e:
+            # The real SDK logs and hands back the error payload for this endpoint
+            logging.error(str(e))
+            return {'status': False, 'message': str(e), 'errorcode': 'AB1004', 'data': None}
+
+        interval_seconds = INTERVAL_SECONDS[historicDataParams['interval']]
+        start = pd.Timestamp(historicDataParams['fromdate'])
+        end = pd.Timestamp(historicDataParams['todate'])
+        times = pd.date_range(start.ceil(f"{interval_seconds}s"), end, freq=f"{interval_seconds}s")
+        if interval_seconds < 86400:
+            times = times[(times.dayofweek < 5) & (times.strftime('%H:%M') >= MARKET_OPEN) & (times.strftime('%H:%M') < MARKET_CLOSE)]
+        else:
+            times = times[times.dayofweek < 5]
+        closes = self._closes(historicDataParams['symboltoken'], times, interval_seconds)
+        opens = np.concatenate([closes[:1], closes[:-1]])
+        highs = np.maximum(opens, closes) + 0.25
+        lows = np.minimum(opens, closes) - 0.25
+        volumes = 1000 + (np.abs(closes - opens) * 10000).astype(int)
+        data = [
+            [t.strftime('%Y-%m-%dT%H:%M:%S+05:30'), round(o, 2), round(h, 2), round(l, 2), round(c, 2), int(v)]
+            for t, o, h, l, c, v in zip(times, opens, highs, lows, closes, volumes)
+        ]
+        return {'status': True, 'message': 'SUCCESS', 'errorcode': '', 'data': data}
+
+    def placeOrder(self, orderparams: Dict[str, Any]) -> str:
+        self._call('placeOrder')
+        order_id = f"SIM{next(self._order_ids):012d}"
+        self.orders.append({'orderid': order_id, 'placed_at': datetime.now(), **orderparams})
+        return order_id
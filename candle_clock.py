@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Callable, List, Optional
+
+# Broker interval name -> candle length in seconds
+INTERVAL_SECONDS: Dict[str, int] = {
+    'ONE_MINUTE': 60,
+    'THREE_MINUTE': 3 * 60,
+    'FIVE_MINUTE': 5 * 60,
+    'TEN_MINUTE': 10 * 60,
+    'FIFTEEN_MINUTE': 15 * 60,
+    'THIRTY_MINUTE': 30 * 60,
+    'ONE_HOUR': 60 * 60,
+    'ONE_DAY': 24 * 60 * 60,
+}
+
+# Fire this long after the boundary so the LTP feed has caught up (the old loop fired at second 1)
+CANDLE_CLOCK_OFFSET_SECONDS = float(os.getenv('CANDLE_CLOCK_OFFSET_SECONDS', 1))
+
+BarCallback = Callable[[str, datetime], None]
+
+
+class CandleClock:
+    """One timer thread that wakes every registered strategy once per candle boundary.
+
+    Bars are numbered by wall-clock (local time) boundary, so a waiter that
+    passes back the last bar it handled never sees the same bar twice, and a
+    clock that wakes late jumps straight to the current bar instead of
+    dropping it.
+    """
+
+    def __init__(self, offset_seconds: float = CANDLE_CLOCK_OFFSET_SECONDS) -> None:
+        self.offset_seconds = offset_seconds
+        self._cond = threading.Condition()
+        self._bars: Dict[str, int] = {}
+        self._callbacks: Dict[str, List[BarCallback]] = {}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _local_seconds(self, now: float) -> float:
+        return now + time.localtime(now).tm_gmtoff - self.offset_seconds
+
+    def _bar_index(self, interval: str, now: float) -> int:
+        return int(self._local_seconds(now) // INTERVAL_SECONDS[interval])
+
+    def _seconds_to_next(self, interval: str, now: float) -> float:
+        length = INTERVAL_SECONDS[interval]
+        return length - self._local_seconds(now) % length
+
+    def bar_time(self, interval: str, bar: int) -> datetime:
+        """Return the local (naive) boundary time of a bar index."""
+        return datetime(1970, 1, 1) + timedelta(seconds=bar * INTERVAL_SECONDS[interval])
+
+    def register(self, interval: str, callback: Optional[BarCallback] = None) -> int:
+        """Start tracking an interval and return the current bar index.
+
+        callback(interval, bar_time) runs on the clock thread at each boundary,
+        before waiters are released.
+        """
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        with self._cond:
+            self._bars.setdefault(interval, self._bar_index(interval, time.time()))
+            if callback is not None:
+                self._callbacks.setdefault(interval, []).append(callback)
+            if not self._stop.is_set() and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="candle-clock", daemon=True)
+                self._thread.start()
+            self._wake.set()
+            return self._bars[interval]
+
+    def wait_for_bar(self, interval: str, last_bar: int, timeout: Optional[float] = None) -> Optional[int]:
+        """Block until a bar newer than last_bar closes and return its index (None on timeout or after stop())."""
+        with self._cond:
+            if interval not in self._bars:
+                raise ValueError(f"Interval not registered: {interval}")
+            if not self._cond.wait_for(lambda: self._stop.is_set() or self._bars[interval] > last_bar, timeout):
+                return None
+            if self._stop.is_set():
+                return None
+            bar = self._bars[interval]
+        if bar > last_bar + 1:
+            logging.warning(f"Woke {bar - last_bar - 1} {interval} bar(s) late; the caller catches up on the missed bars.")
+        return bar
+
+    def stop(self) -> None:
+        """Stop the timer thread for good and release every wait_for_bar() caller."""
+        self._stop.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Cleared before the state is read, so a register() from here on still wakes the next wait
+            self._wake.clear()
+            now = time.time()
+            with self._cond:
+                current = {interval: self._bar_index(interval, now) for interval in self._bars}
+                due = {interval: bar for interval, bar in current.items() if bar > self._bars[interval]}
+                callbacks = {interval: list(self._callbacks.get(interval, [])) for interval in due}
+
+            # Run the bar hooks (e.g. the shared LTP poll) before waking strategies
+            for interval, bar in due.items():
+                for callback in callbacks[interval]:
+                    try:
+                        callback(interval, self.bar_time(interval, bar))
+                    except Exception as e:
+                        logging.error(f"Candle clock callback failed for {interval}: {str(e)}", exc_info=True)
+
+            with self._cond:
+                for interval, bar in due.items():
+                    self._bars[interval] = max(self._bars[interval], bar)
+                if due:
+                    self._cond.notify_all()
+                intervals = list(self._bars)
+
+            # Sleep until the nearest boundary, or until a new interval is registered
+            now = time.time()
+            timeout = min((self._seconds_to_next(interval, now) for interval in intervals), default=60)
+            self._wake.wait(timeout)
+
+
+candle_clock = CandleClock()
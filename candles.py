@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+PRICE_COLUMNS: Tuple[str, ...] = ('open', 'high', 'low', 'close', 'volume')
+
+# Broker date format for getCandleData fromdate/todate
+BROKER_DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+CANDLE_CACHE_DIR = os.getenv('CANDLE_CACHE_DIR', 'candle_cache')
+# Cached bars older than this (before the newest covered time) are dropped on the
+# next merge, unless the request being served still needs them; 0 keeps everything
+CANDLE_CACHE_MAX_AGE_DAYS = float(os.getenv('CANDLE_CACHE_MAX_AGE_DAYS', 30))
+
+# On-disk candle format: npz (compressed, default), npy (one memory-mapped file per
+# column), or parquet/feather (need the optional pyarrow package)
+CANDLE_STORE_FORMAT = os.getenv('CANDLE_STORE_FORMAT', 'npz')
+CANDLE_STORE_EXTENSIONS: Dict[str, str] = {
+    'npz': '.npz',
+    'npy': '.npy.d',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+
+class CandleBuffer:
+    """Fixed-capacity ring buffer of bars backed by NumPy arrays.
+
+    Appending is O(1) and overwrites the oldest bar once the buffer is full,
+    so memory stays flat no matter how long a strategy runs.
+    """
+
+    def __init__(self, capacity: int, columns: Iterable[str] = PRICE_COLUMNS) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self._index: Dict[str, int] = {name: i for i, name in enumerate(self.columns)}
+        # Timestamps stay as objects so tz-aware broker bars and naive DB ticks can coexist
+        self.timestamps = np.empty(capacity, dtype=object)
+        self.values = np.full((capacity, len(self.columns)), np.nan)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _order(self) -> np.ndarray:
+        """Physical slot indices from oldest to newest bar."""
+        start = (self._next - self._size) % self.capacity
+        return (start + np.arange(self._size)) % self.capacity
+
+    def append(self, row: Dict[str, Any]) -> None:
+        """Store one bar; columns missing from row are left as NaN."""
+        slot = self._next
+        self.timestamps[slot] = row.get('timestamp')
+        values = self.values[slot]
+        values.fill(np.nan)
+        for name, i in self._index.items():
+            value = row.get(name)
+            if value is not None:
+                values[i] = value
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, df: pd.DataFrame) -> None:
+        """Bulk-load the newest `capacity` rows of a frame."""
+        for row in df.tail(self.capacity).to_dict(orient='records'):
+            self.append(row)
+
+    def last(self) -> Optional[Dict[str, Any]]:
+        """Return the newest bar as a dict, or None when empty."""
+        if not self._size:
+            return None
+        slot = (self._next - 1) % self.capacity
+        row: Dict[str, Any] = {'timestamp': self.timestamps[slot]}
+        row.update(zip(self.columns, self.values[slot].tolist()))
+        return row
+
+    def since(self, timestamp: Any) -> List[Dict[str, Any]]:
+        """Return the bars stamped after timestamp as dicts, oldest first."""
+        rows: List[Dict[str, Any]] = []
+        for slot in self._order()[::-1]:
+            if self.timestamps[slot] <= timestamp:
+                break
+            row: Dict[str, Any] = {'timestamp': self.timestamps[slot]}
+            row.update(zip(self.columns, self.values[slot].tolist()))
+            rows.append(row)
+        return rows[::-1]
+
+    def column(self, name: str) -> np.ndarray:
+        """Return one column ordered oldest to newest."""
+        if name == 'timestamp':
+            return self.timestamps[self._order()]
+        return self.values[self._order(), self._index[name]]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the buffered bars as a DataFrame, oldest first."""
+        order = self._order()
+        df = pd.DataFrame(self.values[order], columns=list(self.columns))
+        df.insert(0, 'timestamp', self.timestamps[order])
+        return df
+
+
+def _encode_timestamps(timestamps: pd.Series) -> Tuple[np.ndarray, str]:
+    """Split timestamps into int64 UTC nanoseconds and a tz name ('' for naive)."""
+    tz = getattr(timestamps.dt, 'tz', None)
+    utc = timestamps.dt.tz_convert('UTC') if tz is not None else timestamps.dt.tz_localize('UTC')
+    return utc.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').astype(np.int64), str(tz) if tz is not None else ''
+
+
+def _decode_timestamps(values: np.ndarray, tz: str) -> pd.Series:
+    timestamps = pd.Series(pd.to_datetime(np.asarray(values), utc=True))
+    return timestamps.dt.tz_convert(tz) if tz else timestamps.dt.tz_localize(None)
+
+
+def _replace_dir(tmp_path: str, path: str) -> None:
+    # Readers holding memory maps of the old files keep them valid after the swap
+    old_path = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def save_candles(df: pd.DataFrame, path: str, fmt: str = CANDLE_STORE_FORMAT) -> None:
+    """Atomically write a candle frame (timestamp + numeric columns) in a binary columnar format."""
+    if fmt not in CANDLE_STORE_EXTENSIONS:
+        raise ValueError(f"Unsupported candle format: {fmt}")
+    tmp_path = path + '.tmp'
+    columns = [name for name in df.columns if name != 'timestamp']
+    if fmt in ('parquet', 'feather'):
+        # pyarrow stores tz-aware timestamps natively
+        if fmt == 'parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+        return
+
+    timestamps, tz = _encode_timestamps(df['timestamp'])
+    if fmt == 'npz':
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f, timestamp=timestamps, tz=np.array(tz),
+                **{name: df[name].to_numpy(dtype=float) for name in columns},
+            )
+        os.replace(tmp_path, path)
+        return
+
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'timestamp.npy'), timestamps)
+    for name in columns:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), df[name].to_numpy(dtype=float))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'tz': tz, 'columns': columns}, f)
+    _replace_dir(tmp_path, path)
+
+
+def load_candles(path: str, fmt: str = CANDLE_STORE_FORMAT, mmap: bool = True) -> pd.DataFrame:
+    """Read a frame written by save_candles; npy columns are memory-mapped (no copy) when mmap is set."""
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'feather':
+        return pd.read_feather(path)
+    if fmt == 'npz':
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name: data[name] for name in data.files if name not in ('timestamp', 'tz')}
+            df = pd.DataFrame(columns)
+            df.insert(0, 'timestamp', _decode_timestamps(data['timestamp'], str(data['tz'])))
+            return df
+    if fmt == 'npy':
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in meta['columns']}
+        df = pd.DataFrame(columns, copy=False)
+        df.insert(0, 'timestamp', _decode_timestamps(np.load(os.path.join(path, 'timestamp.npy')), meta['tz']))
+        return df
+    raise ValueError(f"Unsupported candle format: {fmt}")
+
+
+def convert_candle_csv(csv_path: str, out_path: Optional[str] = None, fmt: str = CANDLE_STORE_FORMAT) -> str:
+    """Convert a candle CSV (e.g. historical_data1.csv) to a binary store file and return its path."""
+    df = pd.read_csv(csv_path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    out_path = out_path or os.path.splitext(csv_path)[0] + CANDLE_STORE_EXTENSIONS[fmt]
+    save_candles(df, out_path, fmt)
+    logging.info(f"Converted {csv_path} ({len(df)} bars) to {out_path}")
+    return out_path
+
+
+def _local_times(timestamps: pd.Series) -> pd.Series:
+    """Naive wall-clock times, comparable with broker fromdate/todate strings."""
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        return timestamps.dt.tz_localize(None)
+    return timestamps
+
+
+class CandleCache:
+    """In-memory + on-disk cache of raw OHLCV bars keyed by (token, exchange, interval).
+
+    A request only asks the broker for the range the cache has not seen yet
+    (normally just the tail since the last cached bar), so many strategies
+    starting on one symbol cost a single getCandleData call. Each key has its
+    own lock: the first caller fetches, concurrent callers wait and then read
+    from memory. Bars are persisted per key with save_candles() in CANDLE_STORE_FORMAT.
+    Whenever an entry changes, bars more than max_age_days older than its newest
+    covered time are trimmed, so neither memory nor the stored files grow without bound.
+    """
+
+    def __init__(
+        self, cache_dir: Optional[str] = CANDLE_CACHE_DIR, fmt: str = CANDLE_STORE_FORMAT,
+        max_age_days: float = CANDLE_CACHE_MAX_AGE_DAYS,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.fmt = fmt
+        self.max_age = pd.Timedelta(days=max_age_days) if max_age_days > 0 else None
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        # key -> {'df': frame, 'covered_from': Timestamp, 'covered_to': Timestamp}
+        self._entries: Dict[tuple, Dict[str, Any]] = {}
+
+    def _path(self, key: tuple) -> str:
+        token, exchange, interval = key
+        return os.path.join(self.cache_dir, f"{exchange}_{token}_{interval}{CANDLE_STORE_EXTENSIONS[self.fmt]}")
+
+    def _load(self, key: tuple) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path) or not os.path.exists(path + '.meta.json'):
+            return None
+        with open(path + '.meta.json') as f:
+            meta = json.load(f)
+        return {
+            # The cache merges into this frame, so a private copy is wanted here
+            'df': load_candles(path, self.fmt, mmap=False),
+            'covered_from': pd.Timestamp(meta['covered_from']),
+            'covered_to': pd.Timestamp(meta['covered_to']),
+        }
+
+    def _save(self, key: tuple, entry: Dict[str, Any]) -> None:
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        save_candles(entry['df'], path, self.fmt)
+        with open(path + '.meta.json.tmp', 'w') as f:
+            json.dump({'covered_from': str(entry['covered_from']), 'covered_to': str(entry['covered_to'])}, f)
+        os.replace(path + '.meta.json.tmp', path + '.meta.json')
+
+    def _trim(self, entry: Dict[str, Any], keep_from: pd.Timestamp) -> Dict[str, Any]:
+        """Drop bars older than max_age before covered_to, but none at or after keep_from."""
+        if self.max_age is None:
+            return entry
+        cutoff = min(keep_from, entry['covered_to'] - self.max_age)
+        if entry['covered_from'] >= cutoff:
+            return entry
+        df = entry['df']
+        kept = df[(_local_times(df['timestamp']) >= cutoff).to_numpy()].reset_index(drop=True)
+        logging.info(f"Candle cache trimmed {len(df) - len(kept)} bars older than {cutoff}")
+        return {'df': kept, 'covered_from': cutoff, 'covered_to': entry['covered_to']}
+
+    def _key_lock(self, key: tuple) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(
+        self, token: str, exchange: str, interval: str, fromdate: str, todate: str,
+        fetch: Callable[[str, str], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Return bars in [fromdate, todate], calling fetch(fromdate, todate) only for missing ranges."""
+        key = (str(token), exchange, interval)
+        start, end = pd.Timestamp(fromdate), pd.Timestamp(todate)
+        with self._key_lock(key):
+            entry = self._entries.get(key) or self._load(key)
+            if entry is None:
+                logging.info(f"Candle cache miss for {key}, fetching {fromdate} -> {todate}")
+                entry = {'df': fetch(fromdate, todate), 'covered_from': start, 'covered_to': end}
+                changed = True
+            else:
+                # Build the widened entry aside; the cached one is replaced only once every fetch succeeded
+                frames = [entry['df']]
+                covered_from, covered_to = entry['covered_from'], entry['covered_to']
+                changed = False
+                if start < covered_from:
+                    logging.info(f"Candle cache head fetch for {key}: {fromdate} -> {covered_from}")
+                    frames.insert(0, fetch(fromdate, covered_from.strftime(BROKER_DATE_FORMAT)))
+                    covered_from = start
+                    changed = True
+                if end > covered_to:
+                    # Re-fetch from the last cached bar, which may have been incomplete when stored
+                    local = _local_times(entry['df']['timestamp'])
+                    tail_from = local.iloc[-1] if len(local) else covered_to
+                    logging.info(f"Candle cache tail fetch for {key}: {tail_from} -> {todate}")
+                    frames.append(fetch(tail_from.strftime(BROKER_DATE_FORMAT), todate))
+                    covered_to = end
+                    changed = True
+                if changed:
+                    frames = [frame for frame in frames if len(frame)]
+                    merged = pd.concat(frames, ignore_index=True) if frames else entry['df']
+                    entry = {
+                        'df': merged.drop_duplicates(subset='timestamp', keep='last')
+                        .sort_values('timestamp')
+                        .reset_index(drop=True),
+                        'covered_from': covered_from,
+                        'covered_to': covered_to,
+                    }
+
+            if changed:
+                entry = self._trim(entry, start)
+            self._entries[key] = entry
+            if changed:
+                self._save(key, entry)
+            df = entry['df']
+
+        local = _local_times(df['timestamp'])
+        return df[(local >= start) & (local <= end)].reset_index(drop=True)
+
+
+candle_cache = CandleCache()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert candle CSV files to a binary columnar format.")
+    parser.add_argument("csv_paths", nargs="+")
+    parser.add_argument("--format", default=CANDLE_STORE_FORMAT, choices=sorted(CANDLE_STORE_EXTENSIONS))
+    args = parser.parse_args()
+    for csv_path in args.csv_paths:
+        print(convert_candle_csv(csv_path, fmt=args.format))
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+import psql
+from metrics import JOURNAL_COMMIT_SECONDS
+
+# Write-behind settings
+JOURNAL_FLUSH_SECONDS = float(os.getenv('JOURNAL_FLUSH_SECONDS', 0.5))
+JOURNAL_MAX_BATCH = int(os.getenv('JOURNAL_MAX_BATCH', 500))
+JOURNAL_RETRY_SECONDS = float(os.getenv('JOURNAL_RETRY_SECONDS', 2))
+# Failed attempts before a batch is bisected to dead-letter the event(s) that break it
+JOURNAL_MAX_ATTEMPTS = int(os.getenv('JOURNAL_MAX_ATTEMPTS', 5))
+JOURNAL_SPILL_PATH = os.getenv('JOURNAL_SPILL_PATH', 'journal_spill.jsonl')
+# Events that kept failing on their own; kept for inspection, never replayed
+JOURNAL_DEAD_LETTER_PATH = os.getenv('JOURNAL_DEAD_LETTER_PATH', 'journal_dead_letter.jsonl')
+
+ORDER_CREATED_SQL = """
+INSERT INTO order_manager (
+    order_id, completed_order_count, buy_count, sell_count, is_active, created_at, updated_at, user_active_strategy_id
+) VALUES (
+    :order_id, :completed_order_count, :buy_count, :sell_count, :is_active, :created_at, :updated_at, :user_active_strategy_id
+)
+ON CONFLICT (order_id) DO NOTHING;
+"""
+
+# Trade row and order_manager counter in one statement, so they commit (or fail) together
+TRADE_ENTRY_SQL = """
+WITH trade AS (
+    INSERT INTO equity_trade_history (
+        order_id, stock_token, trade_type, quantity, price, entry_ltp, exit_ltp, total_price, trade_entry_time, trade_exit_time
+    ) VALUES (
+        :order_id, :stock_token, :trade_type, :quantity, :price, :entry_ltp, :exit_ltp, :total_price, :trade_entry_time, :trade_exit_time
+    )
+    RETURNING order_id, trade_type
+)
+UPDATE order_manager
+SET buy_count = buy_count + CASE WHEN trade.trade_type = 'BUY' THEN 1 ELSE 0 END,
+    sell_count = sell_count + CASE WHEN trade.trade_type = 'SELL' THEN 1 ELSE 0 END,
+    updated_at = :trade_entry_time
+FROM trade
+WHERE order_manager.order_id = trade.order_id;
+"""
+
+# Only the still-open trade of an order is closed
+TRADE_EXIT_SQL = """
+UPDATE equity_trade_history
+SET exit_ltp = :exit_ltp,
+    trade_exit_time = :trade_exit_time
+WHERE order_id = :order_id
+AND trade_exit_time IS NULL;
+"""
+
+
+def _order_params(order: Dict[str, Any]) -> Dict[str, Any]:
+    now = order.get('created_at') or datetime.now()
+    return {
+        "order_id": order['order_id'],
+        "completed_order_count": 0,
+        "buy_count": 0,
+        "sell_count": 0,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+        "user_active_strategy_id": order['user_active_strategy_id'],
+    }
+
+
+def _entry_params(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "order_id": entry['order_id'],
+        "stock_token": entry['stock_token'],
+        "trade_type": entry['trade_type'],
+        "quantity": entry['quantity'],
+        "price": entry.get('price', 0),
+        "entry_ltp": entry['entry_ltp'],
+        "exit_ltp": 0,
+        "total_price": entry.get('total_price', 0),
+        "trade_entry_time": entry.get('trade_entry_time') or datetime.now(),
+        "trade_exit_time": None,
+    }
+
+
+def _exit_params(exit_: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "order_id": exit_['order_id'],
+        "exit_ltp": exit_['exit_ltp'],
+        "trade_exit_time": exit_.get('trade_exit_time') or datetime.now(),
+    }
+
+
+def journal_trade_entry(
+    order_id: str, stock_token: str, trade_type: str, quantity: int, entry_ltp: float,
+    trade_entry_time: Optional[datetime] = None
+) -> None:
+    """Insert the trade row and bump the order_manager buy/sell counter atomically."""
+    journal_trade_entries([{
+        "order_id": order_id,
+        "stock_token": stock_token,
+        "trade_type": trade_type,
+        "quantity": quantity,
+        "entry_ltp": entry_ltp,
+        "trade_entry_time": trade_entry_time,
+    }])
+
+
+def journal_trade_entries(entries: List[Dict[str, Any]]) -> None:
+    """Journal many entries (e.g. every strategy that fired on one bar) in one transaction."""
+    if not entries:
+        return
+    try:
+        psql.execute_many(TRADE_ENTRY_SQL, [_entry_params(entry) for entry in entries])
+        logging.info(f"Journaled {len(entries)} trade entries.")
+    except Exception as e:
+        logging.error(f"Failed to journal trade entries: {str(e)}", exc_info=True)
+        raise
+
+
+def journal_trade_exit(order_id: str, exit_ltp: float, trade_exit_time: Optional[datetime] = None) -> None:
+    """Close the open trade of an order."""
+    journal_trade_exits([{"order_id": order_id, "exit_ltp": exit_ltp, "trade_exit_time": trade_exit_time}])
+
+
+def journal_trade_exits(exits: List[Dict[str, Any]]) -> None:
+    """Close many open trades in one transaction."""
+    if not exits:
+        return
+    try:
+        psql.execute_many(TRADE_EXIT_SQL, [_exit_params(exit_) for exit_ in exits])
+        logging.info(f"Journaled {len(exits)} trade exits.")
+    except Exception as e:
+        logging.error(f"Failed to journal trade exits: {str(e)}", exc_info=True)
+        raise
+
+
+# Params written to the spill file as text and parsed back on replay
+DATETIME_PARAMS = ('created_at', 'updated_at', 'trade_entry_time', 'trade_exit_time')
+
+# Event kind -> (statement, params builder). A trade_entry also bumps the order's buy/sell counter.
+JOURNAL_EVENTS = {
+    "order_created": (ORDER_CREATED_SQL, _order_params),
+    "trade_entry": (TRADE_ENTRY_SQL, _entry_params),
+    "trade_exit": (TRADE_EXIT_SQL, _exit_params),
+}
+
+
+class JournalWriter:
+    """Background write-behind queue for order and trade journaling.
+
+    Strategy workers submit() events and return immediately. One writer
+    thread drains the queue, groups consecutive events of the same kind into
+    one executemany (arrival order is kept, so an exit never overtakes its
+    entry) and commits each drained batch in a single transaction. Failed
+    batches are retried; a batch that fails max_attempts times while the
+    database is reachable is bisected and the events that still fail on
+    their own are dead-lettered to JOURNAL_DEAD_LETTER_PATH, so one bad
+    event cannot hold back the rest. Whatever still cannot be written at
+    shutdown is spilled to JOURNAL_SPILL_PATH and replayed on the next start.
+    """
+
+    def __init__(
+        self,
+        flush_seconds: float = JOURNAL_FLUSH_SECONDS,
+        max_batch: int = JOURNAL_MAX_BATCH,
+        retry_seconds: float = JOURNAL_RETRY_SECONDS,
+        spill_path: str = JOURNAL_SPILL_PATH,
+        max_attempts: int = JOURNAL_MAX_ATTEMPTS,
+        dead_letter_path: str = JOURNAL_DEAD_LETTER_PATH,
+    ) -> None:
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max(max_attempts, 1)
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the writer thread (idempotent) and requeue any spilled events."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._load_spill()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, kind: str, event: Dict[str, Any]) -> None:
+        """Queue one event; params (including timestamps) are captured now, written later."""
+        if kind not in JOURNAL_EVENTS:
+            raise ValueError(f"Unknown journal event: {kind}")
+        self.start()
+        self._queue.put((kind, JOURNAL_EVENTS[kind][1](event)))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far is committed (or dead-lettered); False on timeout."""
+        done = threading.Event()
+        self._queue.put(done)
+        self.start()
+        return done.wait(timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush what is queued and stop the writer thread."""
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _drain(self, first: Any) -> tuple:
+        events: List[tuple] = []
+        markers: List[threading.Event] = []
+        item = first
+        while True:
+            if isinstance(item, threading.Event):
+                markers.append(item)
+            elif item is not None:
+                events.append(item)
+            if len(events) >= self.max_batch:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+        return events, markers
+
+    def _write(self, events: List[tuple]) -> None:
+        batches: List[tuple] = []
+        for kind, params in events:
+            if batches and batches[-1][0] == kind:
+                batches[-1][1].append(params)
+            else:
+                batches.append((kind, [params]))
+        with JOURNAL_COMMIT_SECONDS.time():
+            psql.execute_batches([(JOURNAL_EVENTS[kind][0], params_list) for kind, params_list in batches])
+
+    def _isolate(self, events: List[tuple]) -> List[tuple]:
+        """Write a failing batch half by half, dead-lettering single events that still fail.
+
+        Returns the events left unwritten because the database itself went
+        away, to be retried as usual.
+        """
+        try:
+            self._write(events)
+            return []
+        except (OperationalError, InterfaceError):
+            # Connection trouble is not the events' fault
+            return events
+        except Exception as e:
+            if len(events) == 1:
+                logging.error(f"Dead-lettering journal event {events[0][0]} after repeated failures: {str(e)}", exc_info=True)
+                self._spill(events, self.dead_letter_path)
+                return []
+        middle = len(events) // 2
+        left = self._isolate(events[:middle])
+        if left:
+            return left + events[middle:]
+        return self._isolate(events[middle:])
+
+    def _run(self) -> None:
+        pending: List[tuple] = []
+        markers: List[threading.Event] = []
+        attempts = 0
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                first = None
+            events, new_markers = self._drain(first)
+            pending.extend(events)
+            markers.extend(new_markers)
+
+            if pending:
+                try:
+                    self._write(pending)
+                    logging.info(f"Journal writer flushed {len(pending)} events.")
+                    pending = []
+                    attempts = 0
+                except Exception as e:
+                    attempts += 1
+                    logging.error(
+                        f"Journal flush of {len(pending)} events failed (attempt {attempts}), will retry: {str(e)}",
+                        exc_info=True
+                    )
+                    if self._stop.is_set():
+                        self._spill(pending)
+                        pending = []
+                    elif attempts >= self.max_attempts:
+                        pending = self._isolate(pending)
+                        attempts = 0
+                        if pending:
+                            self._stop.wait(self.retry_seconds)
+                            continue
+                    else:
+                        self._stop.wait(self.retry_seconds)
+                        continue
+
+            for marker in markers:
+                marker.set()
+            markers = []
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _spill(self, events: List[tuple], path: Optional[str] = None) -> None:
+        path = path or self.spill_path
+        with open(path, "a") as f:
+            for kind, params in events:
+                f.write(json.dumps({"kind": kind, "params": params}, default=str) + "\n")
+        logging.error(f"Spilled {len(events)} unwritten journal events to {path}.")
+
+    def _load_spill(self) -> None:
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        os.remove(self.spill_path)
+        for event in events:
+            params = event["params"]
+            for name in DATETIME_PARAMS:
+                if isinstance(params.get(name), str):
+                    params[name] = datetime.fromisoformat(params[name])
+            self._queue.put((event["kind"], params))
+        logging.info(f"Requeued {len(events)} spilled journal events from {self.spill_path}.")
+
+
+journal_writer = JournalWriter()
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+# Records written per flush by the background writer
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', 256))
+LOG_FORMAT = '%(asctime)s %(levelname)s:%(message)s'
+
+# Signal rows and order responses (formerly appended to signals123.txt / signals.txt)
+SIGNALS_LOG_FILE = os.getenv('SIGNALS_LOG_FILE', 'signals.log')
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that flushes once per batch instead of once per record."""
+
+    def flush(self) -> None:
+        pass
+
+    def flush_batch(self) -> None:
+        super().flush()
+
+
+class _RecordQueueHandler(QueueHandler):
+    """Enqueue the record untouched, so message formatting happens on the writer thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class BatchQueueListener(QueueListener):
+    """Single background writer: drains up to batch_size records, writes them, then flushes once."""
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, batch_size: int = LOG_BATCH_SIZE) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def _flush(self) -> None:
+        for handler in self.handlers:
+            if isinstance(handler, BatchRotatingFileHandler):
+                handler.flush_batch()
+            else:
+                handler.flush()
+
+    def _monitor(self) -> None:
+        while True:
+            record = self.dequeue(True)
+            stop = record is self._sentinel
+            batch = [] if stop else [record]
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.dequeue(False)
+                except queue.Empty:
+                    break
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    batch.append(record)
+            for record in batch:
+                self.handle(record)
+            self._flush()
+            if stop:
+                return
+
+
+_listener: Optional[BatchQueueListener] = None
+
+
+def _file_handler(filename: str) -> BatchRotatingFileHandler:
+    handler = BatchRotatingFileHandler(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def stop_logging() -> None:
+    """Write out everything still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure_logging(filename: str, level: str = LOG_LEVEL) -> None:
+    """Route the root logger (and the 'signals' logger) through a queue to one background file writer.
+
+    Callers only enqueue records: formatting, file writes and rotation all
+    happen on the writer thread. Calling it again re-targets the log file.
+    Use %-style arguments (logging.info("x=%s", x)) on hot paths so that
+    records for disabled levels are never formatted.
+    """
+    global _listener
+    stop_logging()
+
+    log_queue: queue.Queue = queue.Queue()
+    handler = _RecordQueueHandler(log_queue)
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    # Signal rows go to their own file through the same queue, not to the main log
+    signals = logging.getLogger('signals')
+    signals.propagate = False
+    for old in signals.handlers[:]:
+        signals.removeHandler(old)
+    signals.addHandler(handler)
+
+    main_handler = _file_handler(filename)
+    main_handler.addFilter(lambda record: record.name != 'signals')
+    signals_handler = _file_handler(SIGNALS_LOG_FILE)
+    signals_handler.addFilter(lambda record: record.name == 'signals')
+    _listener = BatchQueueListener(log_queue, main_handler, signals_handler)
+    _listener.start()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+
+from services import get_latest_ltp_from_db, get_latest_ltps_from_db
+
+PriceCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class MarketDataHub:
+    """Fetches each distinct token's LTP once per cycle and fans it out to subscribers.
+
+    Strategies on the same token share one query: the hub is polled
+    centrally with poll() (or fed by publish() from a tick feed) and every
+    subscriber callback gets the same price.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Optional[Dict[str, Any]]] = get_latest_ltp_from_db,
+        fetch_many: Optional[Callable[[List[str]], Dict[str, Dict[str, Any]]]] = get_latest_ltps_from_db,
+    ) -> None:
+        self.fetch = fetch
+        self.fetch_many = fetch_many
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Optional[PriceCallback]]] = {}
+        self._token_listeners: List[Callable[[str], None]] = []
+        # token -> (monotonic time of the last price, latest price dict)
+        self._cache: Dict[str, tuple] = {}
+
+    def subscribe(self, token: str, callback: Optional[PriceCallback] = None) -> None:
+        """Register interest in a token; callback(token, latest) runs on every fresh price."""
+        with self._lock:
+            is_new = token not in self._subscribers
+            self._subscribers.setdefault(token, []).append(callback)
+            listeners = list(self._token_listeners) if is_new else []
+        for listener in listeners:
+            listener(token)
+
+    def add_token_listener(self, listener: Callable[[str], None]) -> None:
+        """Call listener(token) for every current token and whenever a new token gets its first subscriber."""
+        with self._lock:
+            self._token_listeners.append(listener)
+            tokens = list(self._subscribers)
+        for token in tokens:
+            listener(token)
+
+    def unsubscribe(self, token: str, callback: Optional[PriceCallback] = None) -> None:
+        """Remove one subscription; the token is dropped once nobody follows it."""
+        with self._lock:
+            subscribers = self._subscribers.get(token)
+            if subscribers is None or callback not in subscribers:
+                return
+            subscribers.remove(callback)
+            if not subscribers:
+                del self._subscribers[token]
+                self._cache.pop(token, None)
+
+    def tokens(self) -> List[str]:
+        """Return every token with at least one subscriber."""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, token: str, latest: Dict[str, Any]) -> None:
+        """Push a price from outside (e.g. a streaming tick) to the cache and subscribers."""
+        self._publish(token, latest)
+
+    def _publish(self, token: str, latest: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[token] = (time.monotonic(), latest)
+            callbacks = [cb for cb in self._subscribers.get(token, []) if cb is not None]
+        for callback in callbacks:
+            try:
+                callback(token, latest)
+            except Exception as e:
+                logging.error(f"Market data subscriber failed for token={token}: {str(e)}", exc_info=True)
+
+    def quiet_tokens(self, max_age_seconds: float) -> List[str]:
+        """Return subscribed tokens with no price in the last max_age_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                token for token in self._subscribers
+                if token not in self._cache or now - self._cache[token][0] > max_age_seconds
+            ]
+
+    def poll(self, tokens: Optional[List[str]] = None, close_at: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch every subscribed (or given) token once and fan the prices out.
+
+        close_at (a candle boundary) stamps the prices just before it, so a
+        poll taken at the boundary closes the ending bar instead of opening
+        the next one with a price from the previous minute.
+        """
+        tokens = tokens if tokens is not None else self.tokens()
+        if len(tokens) > 1 and self.fetch_many is not None:
+            # One round trip for the whole set
+            prices = self.fetch_many(tokens)
+        else:
+            prices = {}
+            for token in tokens:
+                latest = self.fetch(token)
+                if latest:
+                    prices[token] = latest
+        if close_at is not None:
+            stamp = close_at - timedelta(microseconds=1)
+            prices = {token: {**latest, "timestamp": stamp} for token, latest in prices.items()}
+        for token, latest in prices.items():
+            self._publish(token, latest)
+        return prices
+
+
+market_data_hub = MarketDataHub()
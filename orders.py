@@ -0,0 +1,134 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Any, Callable, Optional
+
+from metrics import Histogram
+from services import place_angelone_order
+
+if TYPE_CHECKING:
+    from SmartApi import SmartConnect
+
+# Requests per second per broker endpoint, kept a little under the published
+# per-second limits (20/s for order endpoints, 3/s for historical candles).
+# Override with a JSON object.
+ORDER_RATE_LIMITS: Dict[str, float] = {
+    'placeOrder': 18,
+    'modifyOrder': 18,
+    'cancelOrder': 18,
+    'getCandleData': 3,
+    **json.loads(os.getenv('ORDER_RATE_LIMITS', '{}')),
+}
+# Bucket size. The broker counts requests per second, so a full bucket emptied at
+# once plus a second of refill would exceed it; keep bursts small.
+ORDER_BURST = float(os.getenv('ORDER_BURST', 1))
+# Broker requests in flight at once
+ORDER_DISPATCH_WORKERS = int(os.getenv('ORDER_DISPATCH_WORKERS', 8))
+
+ORDER_DISPATCH_WAIT_SECONDS = Histogram(
+    'order_dispatch_wait_seconds', 'Time an order waited for a rate-limit token before going to the broker.', ['endpoint']
+)
+
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, at most `capacity` saved up.
+
+    acquire() blocks until a token is available. Waiters are served one at
+    a time, so tokens go out in roughly arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float = ORDER_BURST) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._turn = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the seconds waited."""
+        with self._turn:
+            started = time.monotonic()
+            self._refill(started)
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.rate)
+                self._refill(time.monotonic())
+            self.tokens -= 1
+            return time.monotonic() - started
+
+
+class OrderDispatcher:
+    """Single entry point for broker order calls from every strategy thread.
+
+    Each endpoint has its own TokenBucket. Calls run on a small thread pool,
+    so once a call has its token it goes out concurrently with others that
+    are already in flight, in a copy of the caller's context (so its trace
+    span stays a child of the strategy iteration). submit_order() and
+    submit() return Futures; callers that make the request themselves
+    (history loads) take a token with acquire() first.
+    Failed calls are not retried here: a resent order could fill twice.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], "SmartConnect"],
+        rate_limits: Optional[Dict[str, float]] = None,
+        burst: float = ORDER_BURST,
+        max_workers: int = ORDER_DISPATCH_WORKERS,
+    ) -> None:
+        self.connect = connect
+        self.buckets: Dict[str, TokenBucket] = {
+            endpoint: TokenBucket(rate, burst) for endpoint, rate in (rate_limits or ORDER_RATE_LIMITS).items()
+        }
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="order-dispatch")
+            return self._pool
+
+    def acquire(self, endpoint: str) -> None:
+        """Block the calling thread until `endpoint`'s bucket has a token (for calls made outside the pool)."""
+        bucket = self.buckets.get(endpoint)
+        if bucket is not None:
+            waited = bucket.acquire()
+            ORDER_DISPATCH_WAIT_SECONDS.observe(waited, endpoint=endpoint)
+            if waited > 0.5:
+                logging.info(f"{endpoint} waited {waited:.2f}s for the broker rate limit")
+
+    def _dispatch(self, endpoint: str, call: Callable[["SmartConnect"], Any]) -> Any:
+        self.acquire(endpoint)
+        return call(self.connect())
+
+    def _submit(self, endpoint: str, call: Callable[["SmartConnect"], Any]) -> Future:
+        context = contextvars.copy_context()
+        return self._executor().submit(context.run, self._dispatch, endpoint, call)
+
+    def submit(self, endpoint: str, *args: Any) -> Future:
+        """Queue smart_api_obj.<endpoint>(*args); the Future resolves to the broker response."""
+        return self._submit(endpoint, lambda obj: getattr(obj, endpoint)(*args))
+
+    def submit_order(self, order_details: Dict[str, Any]) -> Future:
+        """Queue a placeOrder; the Future resolves to place_angelone_order()'s result (None on failure)."""
+        return self._submit(
+            'placeOrder', lambda obj: place_angelone_order(smart_api_obj=obj, order_details=order_details)
+        )
+
+    def stop(self, wait: bool = True) -> None:
+        """Finish the queued calls and shut the pool down."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
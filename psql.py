@@ -9,13 +9,26 @@ from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Boo
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy import text
+import time
+from metrics import DB_QUERY_SECONDS, DB_QUERY_ERRORS
+from tracing import span
 
 # Load env vars
 load_dotenv()
 
 # --- PostgreSQL Connection Setup ---
 DB_URL = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-engine = create_engine(DB_URL)
+engine = create_engine(
+    DB_URL,
+    pool_size=int(os.getenv('DB_POOL_SIZE', 20)),
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 20)),
+    pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    pool_pre_ping=True,
+    # executemany goes out through psycopg2's execute_batch, one round trip per page rather than per row
+    executemany_mode='values_plus_batch',
+    executemany_batch_page_size=int(os.getenv('DB_BATCH_PAGE_SIZE', 500)),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -145,24 +158,101 @@ def execute_queryv1(raw_sql, params=None):
 
 
 
-def execute_query(raw_sql, params=None):
-    session = SessionLocal()
+_statement_cache = {}
+
+
+def _statement(raw_sql):
+    # Reuse one text() object per SQL string so SQLAlchemy's compiled cache keys stay stable
+    if not isinstance(raw_sql, str):
+        return raw_sql
+    stmt = _statement_cache.get(raw_sql)
+    if stmt is None:
+        stmt = _statement_cache.setdefault(raw_sql, text(raw_sql))
+    return stmt
+
+
+_operation_cache = {}
+
+
+def _operation(raw_sql):
+    # Metric label: the statement's leading keyword (select, insert, update, with, ...)
+    sql = raw_sql if isinstance(raw_sql, str) else getattr(raw_sql, 'text', str(raw_sql))
+    operation = _operation_cache.get(sql)
+    if operation is None:
+        words = sql.split(None, 1)
+        operation = _operation_cache.setdefault(sql, words[0].lower() if words else 'empty')
+    return operation
+
+
+def _format_rows(result, row_format):
+    columns = list(result.keys())
+    rows = result.fetchall()
+    if row_format == "tuple":
+        return [tuple(row) for row in rows]
+    if row_format == "columns":
+        return {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def execute_query(raw_sql, params=None, row_format="dict"):
+    """Run one statement on a pooled connection.
+
+    row_format is "dict" (list of dicts, the default), "tuple" (list of tuples)
+    or "columns" (dict of column name -> list of values).
+    """
+    operation = _operation(raw_sql)
+    started = time.perf_counter()
     try:
-        # Wrap raw_sql in `text()` if it is a string
-        raw_sql = text(raw_sql) if isinstance(raw_sql, str) else raw_sql
-        result = session.execute(raw_sql, params or {})
-        if result.returns_rows:
-            # Convert result to a list of dictionaries
-            columns = result.keys()
-            data = [dict(zip(columns, row)) for row in result.fetchall()]
-            session.close()
-            return data
-        else:
-            session.commit()
-            session.close()
-            return {"status": "success", "message": "Query executed successfully."}
-    except SQLAlchemyError as e:
-        session.rollback()
-        session.close()
-        # logging.error(f"SQLAlchemyError: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        # Only traced as part of a larger operation (e.g. a strategy iteration)
+        with span("psql.execute_query", root=False, **{"db.operation": operation}), engine.connect() as conn:
+            try:
+                result = conn.execute(_statement(raw_sql), params or {})
+                if result.returns_rows:
+                    data = _format_rows(result, row_format)
+                    # Commit as well so INSERT/UPDATE ... RETURNING is persisted
+                    conn.commit()
+                    return data
+                conn.commit()
+                return {"status": "success", "message": "Query executed successfully."}
+            except SQLAlchemyError as e:
+                conn.rollback()
+                # logging.error(f"SQLAlchemyError: {str(e)}", exc_info=True)
+                raise
+    except Exception:
+        DB_QUERY_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+
+def execute_many(raw_sql, params_list):
+    """Run one statement for every params dict as one paged executemany (see executemany_mode)."""
+    if not params_list:
+        return {"status": "success", "message": "No rows to execute."}
+    operation = _operation(raw_sql)
+    with DB_QUERY_SECONDS.time(operation=operation):
+        with engine.connect() as conn:
+            try:
+                conn.execute(_statement(raw_sql), list(params_list))
+                conn.commit()
+                return {"status": "success", "message": f"Query executed for {len(params_list)} rows."}
+            except SQLAlchemyError as e:
+                conn.rollback()
+                DB_QUERY_ERRORS.inc(operation=operation)
+                raise
+
+
+def execute_batches(batches):
+    """Run several (raw_sql, params_list) batches in order inside one transaction."""
+    with DB_QUERY_SECONDS.time(operation="batch"):
+        with engine.connect() as conn:
+            try:
+                for raw_sql, params_list in batches:
+                    if params_list:
+                        conn.execute(_statement(raw_sql), list(params_list))
+                conn.commit()
+                return {"status": "success", "message": "Batches executed successfully."}
+            except SQLAlchemyError as e:
+                conn.rollback()
+                DB_QUERY_ERRORS.inc(operation="batch")
+                raise
\ No newline at end of file
@@ -1,25 +1,50 @@
-import json
 import logging
-from SmartApi import SmartConnect
+import os
+import threading
+import time
 import pandas as pd
 import pyotp
 import numpy as np
 import psql
+from candles import CandleBuffer, PRICE_COLUMNS, candle_cache
 from creds import *
-from typing import Dict, Any, Optional
-
-# Configure logging
-logging.basicConfig(
-    filename='services.log',
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
-
-def get_auth(api_key: str, username: str, pwd: str, token: str) -> SmartConnect:
+from logs import configure_logging
+from tracing import traced
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional
+
+if TYPE_CHECKING:
+    from SmartApi import SmartConnect
+
+# Configure logging (queued, written by a background thread)
+configure_logging('services.log')
+
+# EMA column name -> span used by the crossover strategy
+EMA_SPANS: Dict[str, int] = {'short': 5, 'middle': 21, 'long': 63}
+SIGNAL_COLUMNS = ('buy', 'sell', 'buy_exit', 'sell_exit')
+
+# "angelone" for the real SmartConnect, "simulator" for broker_sim.SimulatedSmartConnect
+BROKER_BACKEND = os.getenv('BROKER_BACKEND', 'angelone')
+
+# Renew cached broker sessions via refresh_token once they are this old
+SESSION_REFRESH_SECONDS = int(os.getenv('SESSION_REFRESH_SECONDS', 6 * 60 * 60))
+# Broker error codes/messages meaning the session's JWT is no longer accepted
+# (invalid, expired or missing token; expired session)
+AUTH_ERROR_MARKERS = ('AG8001', 'AG8002', 'AG8003', 'AB1010', 'Invalid Token', 'Token Expired')
+
+def new_smart_connect(api_key: str) -> "SmartConnect":
+    """Create a broker client for the configured BROKER_BACKEND."""
+    if BROKER_BACKEND == 'simulator':
+        from broker_sim import SimulatedSmartConnect
+        return SimulatedSmartConnect(api_key=api_key)
+    # Imported here so the strategy code (signals, EMAs, bars) works without the broker SDK installed
+    from SmartApi import SmartConnect
+    return SmartConnect(api_key=api_key)
+
+def get_auth(api_key: str, username: str, pwd: str, token: str) -> "SmartConnect":
     """Authenticate and return the SmartConnect object."""
     try:
         logging.info("Authenticating with Angel One API...")
-        obj = SmartConnect(api_key=api_key)
+        obj = new_smart_connect(api_key)
         data = obj.generateSession(username, pwd, pyotp.TOTP(token).now())
 
         global AUTH_TOKEN, FEED_TOKEN, refresh_token, res
@@ -48,46 +73,145 @@ def get_profile() -> Dict[str, Any]:
         logging.error(f"Failed to fetch profile details: {str(e)}", exc_info=True)
         raise
 
-def place_angelone_order(smart_api_obj: SmartConnect, order_details: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+# (api_key, username) -> {'lock', 'obj', 'refresh_token', 'renew_at'}
+_sessions: Dict[tuple, Dict[str, Any]] = {}
+_sessions_lock = threading.Lock()
+
+def _login_session(entry: Dict[str, Any], api_key: str, username: str, pwd: str, token: str) -> None:
+    """Run a full TOTP login and store the new session in entry."""
+    logging.info(f"Creating broker session for username={username}...")
+    obj = new_smart_connect(api_key)
+    data = obj.generateSession(username, pwd, pyotp.TOTP(token).now())
+    entry['obj'] = obj
+    entry['refresh_token'] = data['data']['refreshToken']
+    entry['auth_token'] = data['data']['jwtToken']
+    entry['feed_token'] = data['data']['feedToken']
+    entry['renew_at'] = time.monotonic() + SESSION_REFRESH_SECONDS
+
+def _renew_session(entry: Dict[str, Any], username: str) -> None:
+    """Renew the JWT of an existing session with its refresh token."""
+    logging.info(f"Renewing broker session for username={username}...")
+    response = entry['obj'].generateToken(entry['refresh_token'])
+    if not response or not response.get('data'):
+        raise RuntimeError(f"Token renewal failed: {response}")
+    entry['refresh_token'] = response['data'].get('refreshToken', entry['refresh_token'])
+    entry['auth_token'] = response['data'].get('jwtToken', entry.get('auth_token'))
+    entry['feed_token'] = response['data'].get('feedToken', entry.get('feed_token'))
+    entry['renew_at'] = time.monotonic() + SESSION_REFRESH_SECONDS
+
+def get_session(api_key: str, username: str, pwd: str, token: str) -> "SmartConnect":
+    """Return the shared SmartConnect for these credentials, logging in or renewing only when needed."""
+    key = (api_key, username)
+    with _sessions_lock:
+        entry = _sessions.setdefault(key, {'lock': threading.Lock(), 'obj': None, 'refresh_token': None, 'renew_at': 0.0})
+
+    # Per-credential lock: concurrent workers wait for one login instead of each doing their own
+    with entry['lock']:
+        try:
+            if entry['obj'] is None:
+                _login_session(entry, api_key, username, pwd, token)
+            elif time.monotonic() >= entry['renew_at']:
+                try:
+                    _renew_session(entry, username)
+                except Exception as e:
+                    logging.warning(f"Session renewal failed, logging in again: {str(e)}")
+                    _login_session(entry, api_key, username, pwd, token)
+            return entry['obj']
+        except Exception as e:
+            logging.error(f"Authentication failed: {str(e)}", exc_info=True)
+            raise
+
+def get_session_tokens(api_key: str, username: str, pwd: str, token: str) -> Dict[str, str]:
+    """Return the jwt/feed tokens of the shared session (e.g. for the streaming feed)."""
+    get_session(api_key, username, pwd, token)
+    with _sessions_lock:
+        entry = _sessions[(api_key, username)]
+    return {'auth_token': entry['auth_token'], 'feed_token': entry['feed_token']}
+
+def invalidate_session(smart_api_obj: "SmartConnect") -> None:
+    """Drop the cached session holding smart_api_obj so the next get_session() logs in from scratch.
+
+    Matched by identity, so a session another thread has already replaced is left alone.
+    """
+    with _sessions_lock:
+        entries = [entry for entry in _sessions.values() if entry['obj'] is smart_api_obj]
+    for entry in entries:
+        with entry['lock']:
+            if entry['obj'] is smart_api_obj:
+                entry['obj'] = None
+
+def _drop_session_on_auth_error(smart_api_obj: "SmartConnect", failure: Any) -> None:
+    """Invalidate the session if a broker response or exception says its token was rejected."""
+    text = str(failure)
+    if any(marker in text for marker in AUTH_ERROR_MARKERS):
+        logging.warning(f"Broker rejected the session token, logging in again on next use: {text}")
+        invalidate_session(smart_api_obj)
+
+@traced()
+def place_angelone_order(smart_api_obj: "SmartConnect", order_details: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Place an order using the Angel One SmartAPI."""
     try:
-        logging.info(f"Placing order with details: {json.dumps(order_details, indent=2)}")
+        logging.info("Placing order with details: %s", order_details)
         order_response = smart_api_obj.placeOrder(order_details)
 
         if order_response:
-            logging.info(f"Order placement response: {json.dumps(order_response, indent=2)}")
+            logging.info("Order placement response: %s", order_response)
+            _drop_session_on_auth_error(smart_api_obj, order_response)
         else:
             logging.warning("Received empty response from placeOrder API.")
 
         return order_response
     except Exception as e:
         logging.error(f"An error occurred while placing the order: {str(e)}", exc_info=True)
+        _drop_session_on_auth_error(smart_api_obj, e)
         return None
 
+def fetch_candles(
+    smart_api_obj: "SmartConnect", exchange: str, symboltoken: str, interval: str, fromdate: str, todate: str
+) -> pd.DataFrame:
+    """Fetch raw OHLCV bars from getCandleData."""
+    historic_param = {
+        "exchange": exchange,
+        "symboltoken": symboltoken,
+        "interval": interval,
+        "fromdate": fromdate,
+        "todate": todate,
+    }
+    try:
+        raw_data = smart_api_obj.getCandleData(historic_param)
+    except Exception as e:
+        _drop_session_on_auth_error(smart_api_obj, e)
+        raise
+    if not raw_data or raw_data.get('data') is None:
+        _drop_session_on_auth_error(smart_api_obj, raw_data)
+        raise RuntimeError(f"getCandleData returned no data: {raw_data}")
+
+    columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    data_df = pd.DataFrame(raw_data['data'], columns=columns)
+    data_df['timestamp'] = pd.to_datetime(data_df['timestamp'])
+    return data_df
+
 def get_historical_data(
-    smart_api_obj: SmartConnect, exchange: str, symboltoken: str, interval: str, fromdate: str, todate: str
+    smart_api_obj: "SmartConnect", exchange: str, symboltoken: str, interval: str, fromdate: str, todate: str,
+    throttle: Optional[Callable[[], Any]] = None,
 ) -> Optional[pd.DataFrame]:
-    """Fetch historical data and calculate EMAs."""
+    """Fetch historical data (through the shared candle cache) and calculate EMAs.
+
+    `throttle` is called before every getCandleData request the cache has to
+    make (cache hits skip it), e.g. to wait for a rate-limit token.
+    """
+    def fetch(start: str, end: str) -> pd.DataFrame:
+        if throttle is not None:
+            throttle()
+        return fetch_candles(smart_api_obj, exchange, symboltoken, interval, start, end)
+
     try:
         logging.info(f"Fetching historical data for symboltoken={symboltoken}, interval={interval}")
-        historic_param = {
-            "exchange": exchange,
-            "symboltoken": symboltoken,
-            "interval": interval,
-            "fromdate": fromdate,
-            "todate": todate,
-        }
-        raw_data = smart_api_obj.getCandleData(historic_param)
-        df = pd.DataFrame(raw_data)
-
-        columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-        data_df = pd.DataFrame(df['data'].tolist(), columns=columns)
-        data_df['timestamp'] = pd.to_datetime(data_df['timestamp'])
+        data_df = candle_cache.get(symboltoken, exchange, interval, fromdate, todate, fetch=fetch)
 
         # Calculate EMAs
-        data_df['short'] = data_df['close'].ewm(span=5, adjust=False).mean()
-        data_df['middle'] = data_df['close'].ewm(span=21, adjust=False).mean()
-        data_df['long'] = data_df['close'].ewm(span=63, adjust=False).mean()
+        for name, span in EMA_SPANS.items():
+            data_df[name] = data_df['close'].ewm(span=span, adjust=False).mean()
 
         # Initialize buy/sell columns
         data_df['buy'] = np.nan
@@ -95,13 +219,53 @@ def get_historical_data(
         data_df['buy_exit'] = np.nan
         data_df['sell_exit'] = np.nan
 
-        data_df.to_csv('historical_data.csv', index=False)
-        logging.info("Historical data fetched and saved to historical_data.csv.")
+        logging.info(f"Historical data fetched ({len(data_df)} bars).")
         return data_df
     except Exception as e:
         logging.error(f"An error occurred while fetching historical data: {str(e)}", exc_info=True)
         return None
 
+class EMAState:
+    """Streaming short/middle/long EMAs, updated in O(1) per new price.
+
+    Recent bars are kept in a bounded CandleBuffer (4x the longest span, by
+    which point older bars carry well under 0.1% of the EMA weight), so the
+    full history frame is not held for the life of the strategy.
+    """
+
+    def __init__(self, historical_df: pd.DataFrame, spans: Optional[Dict[str, int]] = None) -> None:
+        self.spans: Dict[str, int] = dict(spans or EMA_SPANS)
+        self.alphas: Dict[str, float] = {name: 2.0 / (span + 1) for name, span in self.spans.items()}
+        self.values: Dict[str, Optional[float]] = {name: None for name in self.spans}
+        self.buffer = CandleBuffer(
+            capacity=4 * max(self.spans.values()),
+            columns=PRICE_COLUMNS + tuple(self.spans) + SIGNAL_COLUMNS,
+        )
+
+        # Seed from the last historical bar; ewm(adjust=False) is fully recursive,
+        # so the last EMA values carry the whole history.
+        if historical_df is not None and not historical_df.empty:
+            historical_df = historical_df.copy()
+            for name, span in self.spans.items():
+                if span != EMA_SPANS.get(name) or name not in historical_df.columns:
+                    historical_df[name] = historical_df['close'].ewm(span=span, adjust=False).mean()
+                self.values[name] = float(historical_df[name].iloc[-1])
+            self.buffer.extend(historical_df)
+
+    def update(self, close: float) -> Dict[str, float]:
+        """Fold one new price into every EMA and return the new values."""
+        if close is None or pd.isna(close):
+            return dict(self.values)
+        close = float(close)
+        for name, alpha in self.alphas.items():
+            prev = self.values[name]
+            self.values[name] = close if prev is None else prev + alpha * (close - prev)
+        return dict(self.values)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the buffered bars as a DataFrame."""
+        return self.buffer.to_frame()
+
 def buy_sell_function12(data: pd.DataFrame) -> tuple:
     """Generate buy/sell signals based on EMA crossover strategy."""
     try:
@@ -203,6 +367,115 @@ def buy_sell_function12(data: pd.DataFrame) -> tuple:
         raise
 
 
+def _next_true(mask: np.ndarray) -> np.ndarray:
+    """For every index i (and len(mask)), the first j >= i where mask[j] is set, else len(mask)."""
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+def buy_sell_vectorized(data: pd.DataFrame) -> tuple:
+    """Array version of buy_sell_function12 for whole frames; returns the same four columns as arrays."""
+    try:
+        logging.info("Generating vectorized buy/sell signals...")
+        short = data['short'].to_numpy(dtype=float)
+        middle = data['middle'].to_numpy(dtype=float)
+        long = data['long'].to_numpy(dtype=float)
+        n = len(short)
+
+        # Like the row loop, a row with any NaN EMA never triggers an entry or exit
+        valid = ~(np.isnan(short) | np.isnan(middle) | np.isnan(long))
+        short_entry = (short < middle) & (middle < long)
+        long_entry = (short > middle) & (middle < long)
+        next_entry = _next_true(short_entry | long_entry)
+        next_short_exit = _next_true(valid & (short > middle))
+        next_long_exit = _next_true(valid & (short < middle))
+
+        buy, sell, buy_exit, sell_exit = np.full((4, n), np.nan)
+
+        # Walk trade by trade rather than row by row: jump to the next entry,
+        # then to the first exit after it.
+        i = 0
+        while i < n:
+            entry = next_entry[i]
+            if entry >= n:
+                break
+            if short_entry[entry]:
+                sell[entry] = 1
+                exit_ = next_short_exit[entry + 1]
+                if exit_ < n:
+                    sell_exit[exit_] = 1
+            else:
+                buy[entry] = 1
+                exit_ = next_long_exit[entry + 1]
+                if exit_ < n:
+                    buy_exit[exit_] = 1
+            i = exit_ + 1
+
+        logging.info("Vectorized buy/sell signals generated successfully.")
+        return buy, sell, buy_exit, sell_exit
+    except Exception as e:
+        logging.error(f"Error generating vectorized buy/sell signals: {str(e)}", exc_info=True)
+        raise
+
+class SignalState:
+    """EMA crossover state machine that carries the long/short flags across ticks."""
+
+    def __init__(self) -> None:
+        self.flag_long = False
+        self.flag_short = False
+
+    def update(self, short: float, middle: float, long: float) -> Optional[str]:
+        """Apply the buy_sell_function12 rules to one bar and return the event, if any."""
+        # Skip if any EMA is NaN
+        if pd.isna(short) or pd.isna(middle) or pd.isna(long):
+            return None
+
+        # Short Entry
+        if not self.flag_short and not self.flag_long and short < middle and middle < long:
+            self.flag_short = True
+            return 'sell'
+        # Short Exit
+        if self.flag_short and short > middle:
+            self.flag_short = False
+            return 'sell_exit'
+        # Long Entry
+        if not self.flag_long and not self.flag_short and short > middle and middle < long:
+            self.flag_long = True
+            return 'buy'
+        # Long Exit
+        if self.flag_long and short < middle:
+            self.flag_long = False
+            return 'buy_exit'
+        return None
+
+class StrategyEngine:
+    """Per-strategy EMA and signal state: feed one price, get one event back."""
+
+    def __init__(self, historical_df: pd.DataFrame, spans: Optional[Dict[str, int]] = None) -> None:
+        self.ema = EMAState(historical_df, spans)
+        self.signals = SignalState()
+        self.last_row: Optional[Dict[str, Any]] = None
+
+    def on_price(self, close: float, timestamp: Any = None) -> Optional[str]:
+        """Fold one price into the EMAs and return 'buy', 'sell', 'buy_exit', 'sell_exit' or None."""
+        return self.on_bar({"timestamp": timestamp, "close": close})
+
+    def on_bar(self, bar: Dict[str, Any]) -> Optional[str]:
+        """Fold one completed OHLCV bar (missing fields stay NaN) into the EMAs and return the event."""
+        row: Dict[str, Any] = {"timestamp": bar.get("timestamp")}
+        for column in PRICE_COLUMNS:
+            row[column] = bar.get(column, np.nan)
+        row["close"] = float(row["close"])
+        row.update(self.ema.update(row["close"]))
+        event = self.signals.update(row['short'], row['middle'], row['long'])
+        for column in SIGNAL_COLUMNS:
+            row[column] = 1 if column == event else np.nan
+        self.ema.buffer.append(row)
+        self.last_row = row
+        return event
+
+
+@traced()
 def get_latest_ltp_from_db(token: str) -> Optional[Dict[str, Any]]:
     """Fetch the latest LTP from the database."""
     sql = """
@@ -212,20 +485,72 @@ def get_latest_ltp_from_db(token: str) -> Optional[Dict[str, Any]]:
     LIMIT 1
     """
     try:
-        logging.info(f"Fetching latest LTP for token={token} from database...")
+        logging.info("Fetching latest LTP for token=%s from database...", token)
         row = psql.execute_query(raw_sql=sql, params={"token": token})
         if row:
-            logging.info(f"Latest LTP fetched: {row[0]}")
+            logging.info("Latest LTP fetched: %s", row[0])
             return {"timestamp": row[0]['last_update'], "close": row[0]['ltp']}
         else:
-            logging.warning(f"No LTP found for token={token}.")
+            logging.warning("No LTP found for token=%s.", token)
             return None
     except Exception as e:
         logging.error(f"Database error while fetching LTP: {str(e)}", exc_info=True)
         return None
 
-def combine_historical_with_live_algo(historical_df: pd.DataFrame, token: str) -> pd.DataFrame:
+@traced()
+def get_latest_ltps_from_db(tokens: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch the latest LTP for many tokens in one query, keyed by token."""
+    tokens = list(dict.fromkeys(str(token) for token in tokens))
+    if not tokens:
+        return {}
+    sql = """
+    SELECT token, last_update, ltp
+    FROM stock_details
+    WHERE token = ANY(:tokens)
+    """
+    try:
+        logging.info("Fetching latest LTP for %d tokens from database...", len(tokens))
+        rows = psql.execute_query(raw_sql=sql, params={"tokens": tokens})
+        latest = {row['token']: {"timestamp": row['last_update'], "close": row['ltp']} for row in rows}
+        missing = [token for token in tokens if token not in latest]
+        if missing:
+            logging.warning("No LTP found for tokens=%s.", missing)
+        return latest
+    except Exception as e:
+        logging.error(f"Database error while fetching LTPs: {str(e)}", exc_info=True)
+        return {}
+
+@traced()
+def update_live_algo(
+    engine: StrategyEngine, token: str, latest: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """Feed the live LTP (fetched from the database unless given), or a completed bar, into the strategy engine."""
+    try:
+        logging.info("Updating live EMAs for token=%s...", token)
+        if latest is None:
+            latest = get_latest_ltp_from_db(token)
+        if not latest:
+            logging.warning("No latest price found. Skipping EMA update.")
+            return None
+
+        if "open" in latest:
+            event = engine.on_bar(latest)
+        else:
+            event = engine.on_price(float(latest["close"]), pd.to_datetime(latest["timestamp"]))
+        logging.info("Live EMAs updated successfully. event=%s", event)
+        return engine.last_row
+    except Exception as e:
+        logging.error(f"Error updating live EMAs: {str(e)}", exc_info=True)
+        raise
+
+def combine_historical_with_live_algo(
+    historical_df: pd.DataFrame, token: str, engine: Optional[StrategyEngine] = None
+) -> pd.DataFrame:
     """Combine historical data with live LTP and recalculate signals."""
+    if engine is not None:
+        update_live_algo(engine, token)
+        return engine.ema.to_frame()
+
     try:
         logging.info(f"Combining historical data with live LTP for token={token}...")
         latest = get_latest_ltp_from_db(token)
@@ -246,12 +571,11 @@ def combine_historical_with_live_algo(historical_df: pd.DataFrame, token: str) -
             combined_df = pd.concat([historical_df, new_row], ignore_index=True)
 
             # Recalculate EMAs
-            combined_df['short'] = combined_df['close'].ewm(span=5, adjust=False).mean()
-            combined_df['middle'] = combined_df['close'].ewm(span=21, adjust=False).mean()
-            combined_df['long'] = combined_df['close'].ewm(span=63, adjust=False).mean()
+            for name, span in EMA_SPANS.items():
+                combined_df[name] = combined_df['close'].ewm(span=span, adjust=False).mean()
 
             # Generate buy/sell signals
-            buy_list, sell_list, buy_exit_list, sell_exit_list = buy_sell_function(combined_df.tail(1))
+            buy_list, sell_list, buy_exit_list, sell_exit_list = buy_sell_function12(combined_df.tail(1))
             combined_df.loc[combined_df.index[-1], 'buy'] = buy_list[0]
             combined_df.loc[combined_df.index[-1], 'sell'] = sell_list[0]
             combined_df.loc[combined_df.index[-1], 'buy_exit'] = buy_exit_list[0]
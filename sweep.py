@@ -0,0 +1,173 @@
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest import load_bars
+from logs import LOG_FORMAT
+from services import EMA_SPANS, buy_sell_vectorized
+
+DEFAULT_SHORT_SPANS = range(3, 16)
+DEFAULT_MIDDLE_SPANS = range(10, 41, 2)
+DEFAULT_LONG_SPANS = range(40, 121, 4)
+
+# Set in each worker by _attach(): symbol -> read-only close array viewing the shared block
+_closes: Dict[str, np.ndarray] = {}
+_shm: Optional[shared_memory.SharedMemory] = None
+
+
+def _reset_worker_logging() -> None:
+    """Drop the queue handler inherited from the parent (its writer thread does not fork); warnings go to stderr."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    for logger, new in ((logging.getLogger(), handler), (logging.getLogger('signals'), logging.NullHandler())):
+        for old in logger.handlers[:]:
+            logger.removeHandler(old)
+        logger.addHandler(new)
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _attach(shm_name: str, layout: List[Tuple[str, int, int]]) -> None:
+    """Worker initializer: reset logging and map every symbol's closes out of the shared block without copying."""
+    global _shm
+    _reset_worker_logging()
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    block = np.ndarray((sum(length for _, _, length in layout),), dtype=np.float64, buffer=_shm.buf)
+    for symbol, offset, length in layout:
+        view = block[offset:offset + length]
+        view.flags.writeable = False
+        _closes[symbol] = view
+
+
+def evaluate_spans(close: np.ndarray, spans: Dict[str, int], warmup_bars: int, ema_cache: Optional[Dict[int, np.ndarray]] = None) -> Dict[str, Any]:
+    """Score one (short, middle, long) combination on a close series.
+
+    Same EMA recursion and signal rules as the live engine (and backtest.run_backtest):
+    EMAs run over the whole series, signals start flat after the warmup bars and
+    fills happen at the close.
+    """
+    ema_cache = {} if ema_cache is None else ema_cache
+    frame = {}
+    for name, span in spans.items():
+        if span not in ema_cache:
+            ema_cache[span] = pd.Series(close).ewm(span=span, adjust=False).mean().to_numpy()
+        frame[name] = ema_cache[span][warmup_bars:]
+    buy, sell, buy_exit, sell_exit = buy_sell_vectorized(pd.DataFrame(frame))
+
+    prices = close[warmup_bars:]
+    # Entries and exits strictly alternate, so pairing sorted events gives the trades
+    entries = np.flatnonzero((buy == 1) | (sell == 1))
+    exits = np.flatnonzero((buy_exit == 1) | (sell_exit == 1))
+    if len(entries) > len(exits):
+        exits = np.append(exits, len(prices) - 1)
+    direction = np.where(buy[entries] == 1, 1.0, -1.0)
+    pnl = (prices[exits] - prices[entries]) * direction
+
+    equity = np.cumsum(pnl)
+    drawdown = float((np.maximum.accumulate(np.maximum(equity, 0)) - equity).max()) if len(equity) else 0.0
+    return {
+        'trades': len(pnl),
+        'win_rate': float((pnl > 0).mean()) if len(pnl) else 0.0,
+        'total_pnl': float(pnl.sum()),
+        'max_drawdown': drawdown,
+    }
+
+
+def _run_chunk(symbol: str, combos: List[Tuple[int, int, int]], warmup_bars: int) -> List[Dict[str, Any]]:
+    close = _closes[symbol]
+    ema_cache: Dict[int, np.ndarray] = {}
+    results = []
+    for short, middle, long in combos:
+        result = evaluate_spans(close, {'short': short, 'middle': middle, 'long': long}, warmup_bars, ema_cache)
+        results.append({'symbol': symbol, 'short': short, 'middle': middle, 'long': long, **result})
+    return results
+
+
+def span_grid(
+    short_spans: Iterable[int] = DEFAULT_SHORT_SPANS,
+    middle_spans: Iterable[int] = DEFAULT_MIDDLE_SPANS,
+    long_spans: Iterable[int] = DEFAULT_LONG_SPANS,
+) -> List[Tuple[int, int, int]]:
+    """All (short, middle, long) combinations with short < middle < long."""
+    return [combo for combo in itertools.product(short_spans, middle_spans, long_spans) if combo[0] < combo[1] < combo[2]]
+
+
+def run_sweep(
+    bars_by_symbol: Dict[str, pd.DataFrame],
+    combos: Sequence[Tuple[int, int, int]],
+    warmup_bars: int = max(EMA_SPANS.values()),
+    max_workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, pd.DataFrame]:
+    """Evaluate every span combination on every symbol across a process pool.
+
+    Close prices are copied once into a shared-memory block; workers view
+    it in place. Returns 'results' (one row per symbol and combination) and
+    'ranking' (combinations ranked by total P&L summed over symbols).
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    layout: List[Tuple[str, int, int]] = []
+    offset = 0
+    for symbol, bars in bars_by_symbol.items():
+        layout.append((symbol, offset, len(bars)))
+        offset += len(bars)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 8)
+    try:
+        block = np.ndarray((offset,), dtype=np.float64, buffer=shm.buf)
+        for symbol, start, length in layout:
+            block[start:start + length] = bars_by_symbol[symbol]['close'].to_numpy(dtype=float)
+
+        # Several chunks per worker keeps every core busy until the end
+        chunk_size = chunk_size or max(1, len(combos) * len(layout) // (max_workers * 4))
+        started = time.perf_counter()
+        rows: List[Dict[str, Any]] = []
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach, initargs=(shm.name, layout)) as pool:
+            futures = [
+                pool.submit(_run_chunk, symbol, list(combos[i:i + chunk_size]), warmup_bars)
+                for symbol, _, _ in layout
+                for i in range(0, len(combos), chunk_size)
+            ]
+            for future in as_completed(futures):
+                rows.extend(future.result())
+        logging.info(
+            f"Span sweep of {len(combos)} combinations x {len(layout)} symbols "
+            f"finished in {time.perf_counter() - started:.2f}s on {max_workers} workers"
+        )
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = pd.DataFrame(rows).sort_values(['symbol', 'total_pnl'], ascending=[True, False]).reset_index(drop=True)
+    ranking = (
+        results.groupby(['short', 'middle', 'long'], as_index=False)
+        .agg(total_pnl=('total_pnl', 'sum'), trades=('trades', 'sum'), win_rate=('win_rate', 'mean'),
+             max_drawdown=('max_drawdown', 'max'))
+        .sort_values('total_pnl', ascending=False)
+        .reset_index(drop=True)
+    )
+    return {'results': results, 'ranking': ranking}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sweep EMA spans over candle files using every core.")
+    parser.add_argument("paths", nargs="+", help="candle files, one per symbol")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--warmup-bars", type=int, default=max(EMA_SPANS.values()))
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", default=None, help="write the full per-symbol results to this CSV")
+    args = parser.parse_args()
+
+    bars_by_symbol = {os.path.basename(path): load_bars(path) for path in args.paths}
+    sweep = run_sweep(bars_by_symbol, span_grid(), args.warmup_bars, args.workers)
+    if args.out:
+        sweep['results'].to_csv(args.out, index=False)
+    print(sweep['ranking'].head(args.top).to_string(index=False))
@@ -0,0 +1,108 @@
+"""Live bars must close on the boundary LTP, and bars a strategy missed must still reach its engine."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bars
+from market_data import MarketDataHub, market_data_hub
+from services import EMA_SPANS, StrategyEngine
+
+TOKEN = '1'
+SESSION_OPEN = datetime(2024, 1, 2, 10, 0)
+
+
+class FakeClock:
+    """Stands in for candle_clock: boundaries fire only when the test says so, in registration order."""
+
+    def __init__(self) -> None:
+        self.callbacks = {}
+
+    def register(self, interval, callback=None):
+        if callback is not None:
+            self.callbacks.setdefault(interval, []).append(callback)
+        return 0
+
+    def close(self, interval, bar_time):
+        for callback in self.callbacks.get(interval, []):
+            callback(interval, bar_time)
+
+
+def _ltp(at: datetime) -> float:
+    # A distinct price every second, so a stale close cannot match by accident
+    return 100 + (at - SESSION_OPEN).total_seconds() / 100
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """A TimeframeBars on a fake clock, seeded with history up to SESSION_OPEN and fed by the boundary poll."""
+    clock = FakeClock()
+    monkeypatch.setattr(bars, 'candle_clock', clock)
+    monkeypatch.setattr(bars, '_aggregators', {})
+    now = {'at': SESSION_OPEN}
+    # stock_details is read a moment after the boundary, like the real poll
+    monkeypatch.setattr(market_data_hub, 'fetch', lambda token: {'timestamp': now['at'], 'close': _ltp(now['at'])})
+    monkeypatch.setattr(market_data_hub, 'fetch_many', None)
+
+    # The same order as app.run_strategies: the poll hook first, then the bar aggregator
+    clock.register(bars.BASE_INTERVAL, lambda interval, bar_time: market_data_hub.poll(close_at=bar_time))
+    timeframe = bars.TimeframeBars('ONE_MINUTE')
+    timeframe.track(TOKEN, 'FIVE_MINUTE')
+    history = pd.DataFrame({
+        'timestamp': pd.date_range(SESSION_OPEN - timedelta(minutes=100), periods=100, freq='1min'),
+        'open': 100.0, 'high': 100.0, 'low': 100.0, 'close': np.linspace(90, 100, 100), 'volume': 0.0,
+    })
+    seeded = timeframe.history(TOKEN, 'FIVE_MINUTE', load=lambda: history)
+
+    def close_minute(minute: int) -> float:
+        """Fire the base boundary SESSION_OPEN + minute and return the LTP polled there."""
+        now['at'] = SESSION_OPEN + timedelta(minutes=minute, seconds=1)
+        clock.close(bars.BASE_INTERVAL, SESSION_OPEN + timedelta(minutes=minute))
+        return _ltp(now['at'])
+
+    yield timeframe, seeded, close_minute
+    timeframe.untrack(TOKEN, 'FIVE_MINUTE')
+
+
+def test_boundary_poll_closes_the_ending_bar(session):
+    timeframe, seeded, close_minute = session
+    assert timeframe.last_bar(TOKEN, 'FIVE_MINUTE')['timestamp'] == seeded['timestamp'].iloc[-1]
+    for minute in range(1, 11):
+        ltp = close_minute(minute)
+        if minute % 5 == 0:
+            evaluated = timeframe.last_bar(TOKEN, 'FIVE_MINUTE')
+            assert evaluated['timestamp'] == SESSION_OPEN + timedelta(minutes=minute - 5)
+            assert evaluated['close'] == ltp
+
+
+def test_missed_bars_are_caught_up(session):
+    timeframe, seeded, close_minute = session
+    engine = StrategyEngine(seeded)
+    # Three 5m bars close while the strategy is not looking
+    closes = []
+    for minute in range(1, 16):
+        ltp = close_minute(minute)
+        if minute % 5 == 0:
+            closes.append(ltp)
+    missed = timeframe.bars_since(TOKEN, 'FIVE_MINUTE', seeded['timestamp'].iloc[-1])
+    assert [bar['timestamp'] for bar in missed] == [SESSION_OPEN + timedelta(minutes=m) for m in (0, 5, 10)]
+    assert [bar['close'] for bar in missed] == closes
+
+    for bar in missed:
+        engine.on_bar(bar)
+    # Same EMAs as a backtest over the full series
+    expected = pd.Series(list(seeded['close']) + closes)
+    for name, span in EMA_SPANS.items():
+        assert engine.last_row[name] == pytest.approx(expected.ewm(span=span, adjust=False).mean().iloc[-1])
+    assert timeframe.bars_since(TOKEN, 'FIVE_MINUTE', missed[-1]['timestamp']) == []
+
+
+def test_quiet_tokens():
+    hub = MarketDataHub(fetch_many=None)
+    hub.subscribe('1')
+    hub.subscribe('2')
+    assert sorted(hub.quiet_tokens(60)) == ['1', '2']
+    hub.publish('1', {'timestamp': SESSION_OPEN, 'close': 100.0})
+    assert hub.quiet_tokens(60) == ['2']
+    assert sorted(hub.quiet_tokens(-1)) == ['1', '2']
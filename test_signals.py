@@ -0,0 +1,57 @@
+"""buy_sell_vectorized must reproduce the row-by-row buy_sell_function12 exactly."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import EMA_SPANS, buy_sell_function12, buy_sell_vectorized
+
+HISTORY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'historical_data1.csv')
+
+
+def _with_emas(close: pd.Series) -> pd.DataFrame:
+    """Add the strategy's EMA columns the way get_historical_data does."""
+    df = pd.DataFrame({'close': close})
+    for name, span in EMA_SPANS.items():
+        df[name] = df['close'].ewm(span=span, adjust=False).mean()
+    return df
+
+
+def _random_walk(seed: int, n: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return _with_emas(pd.Series(100 + np.cumsum(rng.normal(0, 1, n))))
+
+
+def _assert_same_signals(df: pd.DataFrame) -> None:
+    expected = buy_sell_function12(df)
+    actual = buy_sell_vectorized(df)
+    for name, want, got in zip(('buy', 'sell', 'buy_exit', 'sell_exit'), expected, actual):
+        # NaN marks "no signal" in both, and assert_array_equal treats NaN == NaN
+        np.testing.assert_array_equal(np.asarray(got, dtype=float), np.asarray(want, dtype=float), err_msg=name)
+
+
+def test_historical_data():
+    _assert_same_signals(_with_emas(pd.read_csv(HISTORY_CSV)['close']))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_walk(seed):
+    _assert_same_signals(_random_walk(seed))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_nan_gaps(seed):
+    df = _random_walk(seed)
+    rng = np.random.default_rng(seed + 100)
+    # A missing warm-up block, scattered gaps, and gaps in single EMA columns
+    df.loc[:20, list(EMA_SPANS)] = np.nan
+    df.loc[rng.choice(len(df), 100, replace=False), list(EMA_SPANS)] = np.nan
+    for name in EMA_SPANS:
+        df.loc[rng.choice(len(df), 50, replace=False), name] = np.nan
+    _assert_same_signals(df)
+
+
+def test_empty_and_tiny_frames():
+    _assert_same_signals(_with_emas(pd.Series([], dtype=float)))
+    _assert_same_signals(_with_emas(pd.Series([100.0])))
@@ -0,0 +1,187 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from market_data import MarketDataHub, market_data_hub
+
+# "" keeps DB polling; "angelone" streams from SmartWebSocketV2; "replay:<token>:<candle file>" replays locally
+TICK_FEED = os.getenv('TICK_FEED', '')
+TICK_REPLAY_SPEED = float(os.getenv('TICK_REPLAY_SPEED', 1))
+
+# SmartWebSocketV2 constants
+NSE_CM_EXCHANGE_TYPE = 1
+LTP_MODE = 1
+
+TickCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class AngelOneTickSource:
+    """Streams LTP ticks from the broker's SmartWebSocketV2 feed."""
+
+    def __init__(self, auth_token: str, api_key: str, client_code: str, feed_token: str) -> None:
+        from SmartApi.smartWebSocketV2 import SmartWebSocketV2
+
+        self.sws = SmartWebSocketV2(auth_token, api_key, client_code, feed_token)
+        self._lock = threading.Lock()
+        self._tokens: set = set()
+        self._connected = False
+        self._on_tick: Optional[TickCallback] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _subscribe(self, tokens: Iterable[str]) -> None:
+        tokens = list(tokens)
+        if tokens:
+            self.sws.subscribe("setc", LTP_MODE, [{"exchangeType": NSE_CM_EXCHANGE_TYPE, "tokens": tokens}])
+
+    def subscribe(self, token: str) -> None:
+        """Add a token to the stream (now if connected, otherwise on connect)."""
+        with self._lock:
+            if token in self._tokens:
+                return
+            self._tokens.add(token)
+            connected = self._connected
+        if connected:
+            self._subscribe([token])
+
+    def _on_open(self, wsapp: Any) -> None:
+        with self._lock:
+            self._connected = True
+            tokens = list(self._tokens)
+        logging.info(f"Tick feed connected, subscribing {len(tokens)} tokens.")
+        self._subscribe(tokens)
+
+    def _on_data(self, wsapp: Any, message: Dict[str, Any]) -> None:
+        if not isinstance(message, dict) or 'last_traded_price' not in message:
+            return
+        # Prices arrive in paise and exchange_timestamp in epoch milliseconds
+        self._on_tick(str(message['token']), {
+            "timestamp": datetime.fromtimestamp(message['exchange_timestamp'] / 1000),
+            "close": message['last_traded_price'] / 100,
+        })
+
+    def _on_error(self, wsapp: Any, error: Any) -> None:
+        logging.error(f"Tick feed error: {error}")
+
+    def _on_close(self, wsapp: Any) -> None:
+        with self._lock:
+            self._connected = False
+        logging.warning("Tick feed connection closed.")
+
+    def start(self, on_tick: TickCallback) -> None:
+        self._on_tick = on_tick
+        self.sws.on_open = self._on_open
+        self.sws.on_data = self._on_data
+        self.sws.on_error = self._on_error
+        self.sws.on_close = self._on_close
+        self._thread = threading.Thread(target=self.sws.connect, name="tick-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.sws.close_connection()
+
+
+class ReplayTickSource:
+    """Local stand-in for the streaming feed: replays (token, timestamp, price) ticks.
+
+    speed=1 replays in real time from the tick timestamps, larger values
+    replay faster and 0 as fast as possible. Only subscribed tokens are
+    delivered, like the real feed.
+    """
+
+    def __init__(self, ticks: Iterable[Tuple[str, Any, float]], speed: float = TICK_REPLAY_SPEED) -> None:
+        self.ticks = ticks
+        self.speed = speed
+        self._tokens: set = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.finished = threading.Event()
+
+    @classmethod
+    def from_bars(cls, bars: pd.DataFrame, token: str, speed: float = TICK_REPLAY_SPEED) -> "ReplayTickSource":
+        """Turn candles into open/high/low/close ticks for one token."""
+        def ticks():
+            for row in bars.itertuples(index=False):
+                for price in (row.open, row.high, row.low, row.close):
+                    yield token, row.timestamp, float(price)
+        return cls(ticks(), speed)
+
+    def subscribe(self, token: str) -> None:
+        self._tokens.add(str(token))
+
+    def _run(self, on_tick: TickCallback) -> None:
+        started = time.monotonic()
+        first: Optional[pd.Timestamp] = None
+        for token, timestamp, price in self.ticks:
+            if self._stop.is_set():
+                break
+            if self.speed > 0 and timestamp is not None:
+                timestamp = pd.Timestamp(timestamp)
+                first = first if first is not None else timestamp
+                delay = (timestamp - first).total_seconds() / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    self._stop.wait(delay)
+            if token in self._tokens:
+                on_tick(token, {"timestamp": timestamp, "close": price})
+        self.finished.set()
+
+    def start(self, on_tick: TickCallback) -> None:
+        self._thread = threading.Thread(target=self._run, args=(on_tick,), name="tick-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class TickFeed:
+    """Pushes streaming ticks into the MarketDataHub, so strategies see prices within milliseconds.
+
+    Every token the hub's subscribers follow is subscribed on the source
+    automatically; each tick is published to the hub, which updates the
+    cached LTP and runs the subscriber callbacks in-process.
+    """
+
+    def __init__(self, source: Any, hub: MarketDataHub = market_data_hub) -> None:
+        self.source = source
+        self.hub = hub
+        self.ticks = 0
+
+    def _on_tick(self, token: str, latest: Dict[str, Any]) -> None:
+        self.ticks += 1
+        self.hub.publish(token, latest)
+
+    def start(self) -> None:
+        self.hub.add_token_listener(self.source.subscribe)
+        self.source.start(self._on_tick)
+
+    def stop(self) -> None:
+        self.source.stop()
+
+
+def start_tick_feed(feed: str = TICK_FEED, hub: MarketDataHub = market_data_hub) -> Optional[TickFeed]:
+    """Start the configured TICK_FEED, or return None to keep polling stock_details."""
+    if not feed:
+        return None
+    if feed == 'angelone':
+        from creds import api_key, username, pwd, token
+        from services import get_session_tokens
+
+        tokens = get_session_tokens(api_key=api_key, username=username, pwd=pwd, token=token)
+        source: Any = AngelOneTickSource(tokens['auth_token'], api_key, username, tokens['feed_token'])
+    elif feed.startswith('replay:'):
+        from backtest import load_bars
+
+        _, replay_token, path = feed.split(':', 2)
+        source = ReplayTickSource.from_bars(load_bars(path), replay_token)
+    else:
+        raise ValueError(f"Unknown TICK_FEED: {feed}")
+
+    tick_feed = TickFeed(source, hub)
+    tick_feed.start()
+    logging.info(f"Tick feed '{feed}' started.")
+    return tick_feed
+
@@ -0,0 +1,183 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+# Opt-in: spans are written only when TRACE_FILE is set
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# Fraction of root spans (strategy iterations, standalone calls) whose whole trace is kept
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'setc-order-app')
+# Spans written per line of the export file
+TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', 512))
+
+
+class Span:
+    """One timed operation within a sampled trace."""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+# Marks "inside a trace that was not sampled", so nested calls do not start traces of their own
+_NOT_SAMPLED = object()
+_current: ContextVar[Any] = ContextVar('trace_span', default=None)
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    record = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': 1,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': [_attribute(key, value) for key, value in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.error is not None else {'code': 1},
+    }
+    if span.parent_id:
+        record['parentSpanId'] = span.parent_id
+    return record
+
+
+class SpanExporter:
+    """Background writer: appends finished spans to a file as OTLP/JSON, one ExportTraceServiceRequest per line."""
+
+    def __init__(self, path: str, batch_size: int = TRACE_BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(span)
+
+    def stop(self) -> None:
+        """Write out queued spans and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _write(self, spans: List[Span]) -> None:
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [_attribute('service.name', TRACE_SERVICE_NAME)]},
+                'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': [_otlp_span(span) for span in spans]}],
+            }]
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(request) + '\n')
+
+    def _run(self) -> None:
+        while True:
+            span = self._queue.get()
+            stop = span is None
+            spans = [] if stop else [span]
+            while not stop and len(spans) < self.batch_size:
+                try:
+                    span = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                else:
+                    spans.append(span)
+            if spans:
+                try:
+                    self._write(spans)
+                except Exception as e:
+                    logging.error(f"Failed to export {len(spans)} trace spans: {str(e)}", exc_info=True)
+            if stop:
+                return
+
+
+_exporter: Optional[SpanExporter] = SpanExporter(TRACE_FILE) if TRACE_FILE else None
+if _exporter is not None:
+    atexit.register(_exporter.stop)
+
+
+@contextmanager
+def span(name: str, root: bool = True, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the with-block as a span; yields the Span, or None when it is not recorded.
+
+    Outside any trace a new (sampled) trace is started unless root=False,
+    which suits low-level calls such as database queries that are only
+    interesting as part of a larger operation.
+    """
+    parent = _current.get()
+    if _exporter is None or parent is _NOT_SAMPLED or (parent is None and not root):
+        yield None
+        return
+    if parent is None and random.random() >= TRACE_SAMPLE_RATE:
+        token = _current.set(_NOT_SAMPLED)
+        try:
+            yield None
+        finally:
+            _current.reset(token)
+        return
+
+    trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+    current = Span(name, trace_id, parent.span_id if parent is not None else '', attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        _exporter.export(current)
+
+
+def traced(name: Optional[str] = None, root: bool = True) -> Callable[[Callable], Callable]:
+    """Decorator form of span(); a no-op unless tracing is enabled."""
+    def decorator(func: Callable) -> Callable:
+        if _exporter is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name or func.__name__, root=root):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator